@@ -1,4 +1,8 @@
 
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import redirect
 from django.contrib import messages
 
@@ -6,7 +10,7 @@ def teacher_required(function):
     def wrap(request, *args, **kwargs):
         # 1. 로그인이 안 되어 있으면 -> 로그인 페이지로
         if not request.user.is_authenticated:
-            return redirect('login')
+            return redirect_to_login(request.get_full_path())
         
         # 2. 학생 또는 승인 전 교사는 교사 전용 기능에 접근할 수 없음
         if request.user.role == 'STUDENT':
@@ -20,3 +24,26 @@ def teacher_required(function):
         # 3. 통과 (승인된 교사 이상)
         return function(request, *args, **kwargs)
     return wrap
+
+
+def async_teacher_required(function):
+    """teacher_required의 비동기 뷰용 버전입니다.
+
+    Django 4.2의 login_required·teacher_required는 비동기 뷰를 감싸지 못하므로,
+    같은 검사(세션 사용자 조회 포함)를 스레드에서 실행한 뒤 통과하면 원래 뷰를 기다립니다.
+    """
+    @wraps(function)
+    async def wrap(request, *args, **kwargs):
+        denied = await sync_to_async(teacher_required(lambda request, *args, **kwargs: None))(
+            request, *args, **kwargs
+        )
+        if denied is not None:
+            return denied
+        return await function(request, *args, **kwargs)
+    return wrap
+
+
+def async_csrf_exempt(view_func):
+    # Django 4.2의 csrf_exempt는 비동기 뷰를 동기 함수로 감싸 버리므로 표시만 붙입니다.
+    view_func.csrf_exempt = True
+    return view_func
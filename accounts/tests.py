@@ -2,8 +2,11 @@ from pathlib import Path
 import inspect
 import re
 from types import SimpleNamespace
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
+import asyncio
+import json
 
+from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.http import HttpResponse
@@ -12,7 +15,7 @@ from django.urls import resolve, reverse
 from django.template.loader import get_template
 
 from .middleware import StudentSessionValidationMiddleware
-from .views import admin_system_settings, login_view, persona_create
+from .views import admin_system_settings, api_process_one_row, login_view, persona_create
 
 
 class AdminSystemSettingsPersonaTests(SimpleTestCase):
@@ -168,3 +171,33 @@ class CsrfAndSessionConsistencyTests(SimpleTestCase):
                     missing.append(f'{path}:{source.count(chr(10), 0, form.start()) + 1}')
 
         self.assertEqual(missing, [])
+
+
+class AiGeneratorRowApiTests(SimpleTestCase):
+    def post_row(self, user):
+        request = RequestFactory().post(
+            reverse('api_process_one_row'),
+            data=json.dumps({'index': 0, 'selected_cols': ['이름'], 'prompt_system': '요약'}),
+            content_type='application/json',
+        )
+        request.user = user
+        return async_to_sync(api_process_one_row)(request)
+
+    def test_row_api_is_async_and_awaits_model_call(self):
+        self.assertTrue(asyncio.iscoroutinefunction(api_process_one_row))
+        self.assertTrue(api_process_one_row.csrf_exempt)
+        response_data = {'choices': [{'message': {'content': '생성 결과'}}]}
+        teacher = SimpleNamespace(is_authenticated=True, role='TEACHER', is_approved=True)
+        with patch('accounts.views.build_row_prompt', return_value='[기초자료]\n[학생이름: 홍길동]') as build, \
+                patch('accounts.views.SystemConfig.objects.get', return_value=SimpleNamespace(value='key-a,key-b')), \
+                patch('accounts.views.allm_request', AsyncMock(return_value=SimpleNamespace(
+                    status_code=200, json=lambda: response_data))) as post:
+            response = self.post_row(teacher)
+        self.assertEqual({'status': 'success', 'result': '생성 결과'}, json.loads(response.content))
+        self.assertEqual(0, build.call_args.args[2])
+        self.assertEqual(['key-a', 'key-b'], post.call_args.kwargs['api_keys'])
+
+    def test_row_api_redirects_anonymous_user_to_login(self):
+        response = self.post_row(AnonymousUser())
+        self.assertEqual(302, response.status_code)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
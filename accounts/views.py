@@ -17,10 +17,10 @@ from django.contrib.auth import authenticate,login as auth_login
 from django.contrib.sessions.models import Session # 로그인 처리 함수 (회원가입 후 자동 로그인 위해 필요)
 from django.middleware.csrf import get_token, rotate_token
 from django.utils import timezone
-import requests
-import random
+from asgiref.sync import sync_to_async
 import logging
 from activities.views import get_form_config
+from activities.llm_transport import allm_request
 import openai
 import io
 import json
@@ -29,7 +29,7 @@ from openpyxl import Workbook   # 엑셀 파일 생성 및 조작을 위해 필
 from .forms import CustomUserCreationForm, StudentForm, UserUpdateForm, CustomAuthenticationForm  # 회원가입 폼, 학생 등록 폼, 사용자 정보 수정 폼, 로그인 폼
 from .models import Student, CustomUser, School, Persona # 학교 모델 가져오기
 from .models import SystemConfig, PromptCategory, PromptLengthOption, PromptTemplate # AI 생성기 관련 모델 가져오기
-from .decorators import teacher_required    # 교사 전용 접근 제어 데코레이터
+from .decorators import async_csrf_exempt, async_teacher_required, teacher_required    # 교사 전용 접근 제어 데코레이터
 from activities.models import Activity, Student, Answer  # 평가관리, 학생, 답안 모델 가져오기
 from activities.views.main_views import get_accessible_students, get_student_tree
 
@@ -888,13 +888,13 @@ def ai_generator_step2(request):
     # 여기서는 무조건 화면(HTML)만 보여주면 됩니다.
     return render(request, 'accounts/ai_generator_step2.html', context)
 
-def call_openai_api(api_key, model, prompt_system, prompt_user, temperature=0.7):
+async def call_openai_api(api_key, model, prompt_system, prompt_user, temperature=0.7):
     """
     OpenAI API를 직접 호출하는 헬퍼 함수
+    api_key는 쉼표로 여러 개를 넘길 수 있으며, 한도가 가장 여유 있는 키가 선택됩니다.
     """
     url = "https://api.openai.com/v1/chat/completions"
     headers = {
-        "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
     payload = {
@@ -907,7 +907,7 @@ def call_openai_api(api_key, model, prompt_system, prompt_user, temperature=0.7)
     }
     
     # 가비아 환경의 특성을 고려해 timeout 60초 설정
-    response = requests.post(url, headers=headers, json=payload, timeout=60)
+    response = await allm_request(url, api_keys=api_key, headers=headers, json=payload, timeout=60)
     
     if response.status_code == 200:
         return response.json()['choices'][0]['message']['content']
@@ -916,11 +916,44 @@ def call_openai_api(api_key, model, prompt_system, prompt_user, temperature=0.7)
         error_msg = response.json().get('error', {}).get('message', '알 수 없는 에러')
         print(f"DEBUG: OpenAI API Error ({response.status_code}): {error_msg}")
         raise Exception(f"AI 응답 실패: {error_msg}")
+
+
+def build_row_prompt(request, selected_cols, row_index, prompt_system):
+    """세션에 올려 둔 엑셀의 한 행으로 프롬프트를 만듭니다. 실행하지 않을 행이면 None을 반환합니다."""
+    # 세션에서 데이터 원본 가져오기
+    df_json = request.session.get('df_data')
+    df = pd.read_json(df_json)
+    
+    # 해당 행(Row) 데이터 가져오기
+    row = df.iloc[row_index]
+    
+    # 실행여부 체크
+    if '실행여부' in df.columns:
+        val = str(row['실행여부']).strip().lower()
+        if val not in ['1', '1.0', 'true']:
+            return None
+
+    # 프롬프트 재료 조합
+    context_parts = []
+    for col in selected_cols:
+        if col in row:
+            val = str(row[col])
+            if '이름' in col or 'name' in col.lower():
+                context_parts.append(f"[학생이름: {val}]")
+            else:
+                context_parts.append(f"{col}: {val}")
+    
+    context_text = " / ".join(context_parts)
     
+    return f"[기초자료]\n{context_text}\n\n[지시사항]\n{prompt_system}"
+
+
 # 1명씩 처리하는 API (JavaScript가 호출함)
-@csrf_exempt
-@login_required
-def api_process_one_row(request):
+# 모델 응답(최대 60초)을 기다리는 동안 워커 스레드를 붙잡지 않도록 비동기 뷰로 둡니다.
+# 세션·DB 조회는 sync_to_async로 스레드에서 실행합니다.
+@async_csrf_exempt
+@async_teacher_required
+async def api_process_one_row(request):
     if request.method == 'POST':
         try:
             body = json.loads(request.body)
@@ -931,32 +964,9 @@ def api_process_one_row(request):
             # 분석 모델은 프론트엔드 전달값을 무시하고 서버에서 고정합니다.
             ai_model = FORCED_AI_ANALYSIS_MODEL
             
-            # 세션에서 데이터 원본 가져오기
-            df_json = request.session.get('df_data')
-            df = pd.read_json(df_json)
-            
-            # 해당 행(Row) 데이터 가져오기
-            row = df.iloc[row_index]
-            
-            # 실행여부 체크
-            if '실행여부' in df.columns:
-                val = str(row['실행여부']).strip().lower()
-                if val not in ['1', '1.0', 'true']:
-                    return JsonResponse({'status': 'skip', 'result': ''})
-
-            # 프롬프트 재료 조합
-            context_parts = []
-            for col in selected_cols:
-                if col in row:
-                    val = str(row[col])
-                    if '이름' in col or 'name' in col.lower():
-                        context_parts.append(f"[학생이름: {val}]")
-                    else:
-                        context_parts.append(f"{col}: {val}")
-            
-            context_text = " / ".join(context_parts)
-            
-            final_prompt = f"[기초자료]\n{context_text}\n\n[지시사항]\n{prompt_system}"
+            final_prompt = await sync_to_async(build_row_prompt)(request, selected_cols, row_index, prompt_system)
+            if final_prompt is None:
+                return JsonResponse({'status': 'skip', 'result': ''})
             result_text = ""
 
             # ---------------------------------------------------------
@@ -964,18 +974,16 @@ def api_process_one_row(request):
             # ---------------------------------------------------------
             if ai_model.startswith('gpt'):
                 # 1. 키 가져오기 (멀티 키 지원)
-                config = SystemConfig.objects.get(key_name='OPENAI_API_KEY')
+                config = await sync_to_async(SystemConfig.objects.get)(key_name='OPENAI_API_KEY')
                 api_keys_list = [k.strip() for k in config.value.split(',') if k.strip()]
                 
                 if not api_keys_list:
                     return JsonResponse({'status': 'error', 'message': 'OpenAI API 키가 없습니다.'})
-            
-                selected_key = random.choice(api_keys_list) # 랜덤 키 선택
 
                 # 2. [변경 포인트] 라이브러리 대신 직접 만든 call_openai_api 함수 호출
                 try:
-                    result_text = call_openai_api(
-                        api_key=selected_key,
+                    result_text = await call_openai_api(
+                        api_key=api_keys_list,  # 키 선택·한도·재시도는 allm_request가 담당
                         model=ai_model,
                         prompt_system="당신은 생활기록부 전문가입니다.", # 시스템 역할
                         prompt_user=final_prompt,                      # 조합된 데이터 + 지시사항
@@ -990,11 +998,11 @@ def api_process_one_row(request):
             # ---------------------------------------------------------
             elif ai_model.startswith('gemini'):
                 try:
-                    config = SystemConfig.objects.get(key_name='GOOGLE_API_KEY')
+                    config = await sync_to_async(SystemConfig.objects.get)(key_name='GOOGLE_API_KEY')
                     api_key = config.value
                     
                     # Gemini API 주소 (REST API)
-                    url = f"https://generativelanguage.googleapis.com/v1beta/models/{ai_model}:generateContent?key={api_key}"
+                    url = f"https://generativelanguage.googleapis.com/v1beta/models/{ai_model}:generateContent"
                     
                      # 보낼 데이터 포장
                     payload = {
@@ -1006,8 +1014,8 @@ def api_process_one_row(request):
                         }
                     }
                     
-                    # 직접 전송 (requests 사용)
-                    response = requests.post(url, json=payload)
+                    # 직접 전송 (공용 연결 풀·호출 한도 관리 사용)
+                    response = await allm_request(url, api_keys=api_key, json=payload, timeout=60)
                     response_data = response.json()
                     
                     # 결과 추출
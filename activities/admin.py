@@ -1,9 +1,14 @@
 from django.contrib import admin
 from .models import (
+    AIMonthlySpend,
+    AIRequestIdempotency,
+    AIResponseCache,
     AIUsageLog,
     Activity,
     ActivityAnalysisContext,
     ActivityFile,
+    AnalysisJob,
+    AnalysisJobItem,
     Answer,
     FeedbackResult,
     FeedbackSession,
@@ -64,25 +69,75 @@ class FeedbackSessionAdmin(admin.ModelAdmin):
 
 @admin.register(ActivityFile)
 class ActivityFileAdmin(admin.ModelAdmin):
-    list_display = ['filename', 'activity', 'extraction_status', 'extracted_char_count', 'extracted_at']
+    list_display = [
+        'filename', 'activity', 'extraction_status', 'extracted_char_count', 'extraction_stop_reason',
+        'ocr_cost_usd', 'ocr_bytes_saved', 'extracted_at',
+    ]
     list_filter = ['extraction_status', 'created_at']
     search_fields = ['activity__title', 'file', 'content_hash']
-    readonly_fields = ['content_hash', 'extracted_text', 'extracted_char_count', 'extracted_at', 'extraction_error']
+    readonly_fields = [
+        'content_hash', 'extracted_text', 'extracted_char_count', 'extraction_stop_reason', 'extracted_at',
+        'extraction_error', 'ocr_cost_usd', 'ocr_bytes_saved',
+    ]
 
 
 @admin.register(ActivityAnalysisContext)
 class ActivityAnalysisContextAdmin(admin.ModelAdmin):
-    list_display = ['activity', 'summary_model', 'updated_at']
+    list_display = ['activity', 'question', 'summary_model', 'updated_at']
     search_fields = ['activity__title', 'source_fingerprint']
     readonly_fields = ['source_fingerprint', 'structured_context', 'summary_text', 'summary_usage', 'created_at', 'updated_at']
 
 
 @admin.register(AIUsageLog)
 class AIUsageLogAdmin(admin.ModelAdmin):
-    list_display = ['teacher', 'activity', 'operation', 'ai_model', 'total_tokens', 'estimated_cost_usd', 'created_at']
-    list_filter = ['operation', 'ai_model', 'created_at']
-    search_fields = ['teacher__name', 'activity__title']
+    list_display = [
+        'teacher', 'activity', 'operation', 'ai_model', 'batch_id', 'total_tokens', 'cached_tokens',
+        'estimated_cost_usd', 'is_cache_hit', 'saved_cost_usd', 'created_at',
+    ]
+    list_filter = ['operation', 'ai_model', 'is_cache_hit', 'created_at']
+    search_fields = ['teacher__name', 'activity__title', 'batch_id']
     readonly_fields = [
-        'teacher', 'activity', 'answer', 'operation', 'ai_model', 'prompt_tokens',
-        'cached_tokens', 'completion_tokens', 'total_tokens', 'estimated_cost_usd', 'created_at',
+        'teacher', 'activity', 'answer', 'operation', 'ai_model', 'batch_id', 'prompt_tokens',
+        'cached_tokens', 'completion_tokens', 'total_tokens', 'estimated_cost_usd',
+        'is_cache_hit', 'saved_cost_usd', 'created_at',
     ]
+
+
+@admin.register(AIMonthlySpend)
+class AIMonthlySpendAdmin(admin.ModelAdmin):
+    list_display = ['teacher', 'month', 'spent_usd', 'updated_at']
+    list_filter = ['month']
+    search_fields = ['teacher__name']
+    readonly_fields = ['teacher', 'month', 'spent_usd', 'updated_at']
+
+
+@admin.register(AIResponseCache)
+class AIResponseCacheAdmin(admin.ModelAdmin):
+    list_display = ['request_hash', 'ai_model', 'hit_count', 'estimated_cost_usd', 'created_at', 'last_used_at']
+    list_filter = ['ai_model']
+    search_fields = ['request_hash']
+    readonly_fields = ['request_hash', 'ai_model', 'result_text', 'estimated_cost_usd', 'hit_count', 'created_at', 'last_used_at']
+
+
+
+@admin.register(AIRequestIdempotency)
+class AIRequestIdempotencyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'teacher', 'status', 'created_at', 'updated_at']
+    list_filter = ['status']
+    search_fields = ['key', 'teacher__name']
+    readonly_fields = ['teacher', 'key', 'status', 'response_body', 'created_at', 'updated_at']
+
+class AnalysisJobItemInline(admin.TabularInline):
+    model = AnalysisJobItem
+    extra = 0
+    fields = ['answer', 'status', 'attempts', 'message', 'analysis_result', 'started_at', 'finished_at']
+    readonly_fields = fields
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ['work_name', 'activity', 'teacher', 'status', 'total_count', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['work_name', 'batch_id', 'activity__title', 'teacher__name']
+    readonly_fields = ['options', 'representative_map', 'heartbeat_at', 'created_at', 'started_at', 'finished_at']
+    inlines = [AnalysisJobItemInline]
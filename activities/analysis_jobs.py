@@ -0,0 +1,382 @@
+"""브라우저 탭과 무관하게 서버에서 일괄 AI 분석을 실행·재개하는 작업 계층."""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from accounts.models import SystemConfig
+from .attachment_context import get_batch_prompt_cache_stats
+from .background import run_in_background
+from .delta_analysis import copy_forward_results
+from .llm_scheduler import BATCH, llm_caller
+from .models import AnalysisJob, AnalysisJobItem, Answer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_CONCURRENCY = 4
+# 답안 하나(4번 시도 × 60초 + 대기, 묶음 180초 뒤 단일 재처리)보다 넉넉히 길어야 살아 있는 작업을 넘겨받지 않습니다.
+DEFAULT_JOB_STALE_SECONDS = 900
+# 작업자가 답안을 처리하는 동안에도 이 간격으로 처리 신호를 갱신합니다.
+DEFAULT_JOB_HEARTBEAT_SECONDS = 30
+MAX_ITEM_ATTEMPTS = 3
+# 짧은 답안은 이 개수까지 한 요청으로 묶어 분석합니다(1 이하면 묶지 않음).
+DEFAULT_ANALYSIS_PACK_SIZE = 5
+REUSED_RESULT_MESSAGE = '답안 변경 없음 - 이전 분석 결과를 이어 씀'
+
+# 답안마다 api_process_db_row에 보내던 본문 중 작업 전체에 공통인 옵션만 보관합니다.
+ANALYSIS_JOB_OPTION_KEYS = (
+    'prompt_system',
+    'temperature',
+    'selected_persona_id',
+    'selected_tone',
+    'requested_length',
+    'task_type',
+    'tone_attributes',
+    'tone_scale',
+    'feedback_components',
+    'teacher_types',
+    'pack_answers',
+)
+
+_active_workers = {}
+_active_workers_lock = threading.Lock()
+
+
+def clean_analysis_job_options(body):
+    return {key: body[key] for key in ANALYSIS_JOB_OPTION_KEYS if key in body}
+
+
+def get_job_concurrency():
+    return max(int(getattr(settings, 'AI_ANALYSIS_JOB_CONCURRENCY', DEFAULT_JOB_CONCURRENCY)), 1)
+
+
+def get_analysis_pack_size():
+    return int(getattr(settings, 'AI_ANALYSIS_PACK_SIZE', DEFAULT_ANALYSIS_PACK_SIZE))
+
+
+def get_job_stale_seconds():
+    return int(getattr(settings, 'AI_ANALYSIS_JOB_STALE_SECONDS', DEFAULT_JOB_STALE_SECONDS))
+
+
+def get_job_heartbeat_seconds():
+    return float(getattr(settings, 'AI_ANALYSIS_JOB_HEARTBEAT_SECONDS', DEFAULT_JOB_HEARTBEAT_SECONDS))
+
+
+@contextmanager
+def job_heartbeat(job_id):
+    """작업자가 살아 있는 동안 별도 스레드에서 처리 신호를 갱신합니다.
+
+    답안 하나가 재시도·묶음 재처리로 오래 걸려도 다른 프로세스가 멈춘 작업으로 보고
+    같은 답안을 다시 분석(이중 과금)하지 않게 합니다.
+    """
+    stopped = threading.Event()
+
+    def tick():
+        try:
+            while not stopped.wait(get_job_heartbeat_seconds()):
+                try:
+                    AnalysisJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now())
+                except Exception:
+                    logger.exception('분석 작업 처리 신호 갱신 실패: job_id=%s', job_id)
+        finally:
+            connection.close()
+
+    ticker = threading.Thread(target=tick, name=f'analysis-job-{job_id}-heartbeat', daemon=True)
+    ticker.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+
+
+def create_analysis_job(*, activity, teacher, work_name, batch_id, answer_ids, options, unchanged_results=None,
+                        representative_map=None):
+    """활동에 속한 답안만 골라 작업과 답안별 상태 행을 만듭니다. 속한 답안이 없으면 아무것도 만들지 않고 None.
+
+    unchanged_results({답안 id: 이전 AnalysisResult})의 답안은 바뀌지 않은 것으로, 이전 결과를 새 batch로 복사해
+    완료 상태로 넣습니다. 복사는 작업 생성과 같은 트랜잭션에서 하므로 작업 없이 결과만 남지 않습니다.
+    representative_map({건너뛴 답안 id: 대표 답안 id})은 결과 화면이 대표 결과를 보여줄 수 있게 작업에 남깁니다.
+    """
+    unchanged_results = unchanged_results or {}
+    answer_ids = list(
+        Answer.objects.filter(question__activity=activity, id__in=[*answer_ids, *unchanged_results])
+        .order_by('student__grade', 'student__class_no', 'student__number', 'id')
+        .values_list('id', flat=True)
+    )
+    if not answer_ids:
+        return None
+    with transaction.atomic():
+        job = AnalysisJob.objects.create(
+            activity=activity,
+            teacher=teacher,
+            work_name=work_name,
+            batch_id=batch_id,
+            options=clean_analysis_job_options(options),
+            representative_map={str(answer_id): representative_id for answer_id, representative_id in (representative_map or {}).items()},
+            total_count=len(answer_ids),
+        )
+        job_answer_ids = set(answer_ids)
+        reused_results = copy_forward_results(
+            {answer_id: result for answer_id, result in unchanged_results.items() if answer_id in job_answer_ids},
+            batch_id,
+        )
+        now = timezone.now()
+        AnalysisJobItem.objects.bulk_create([
+            AnalysisJobItem(
+                job=job,
+                answer_id=answer_id,
+                status=AnalysisJobItem.Status.SUCCESS,
+                message=REUSED_RESULT_MESSAGE,
+                analysis_result_id=reused_results[answer_id],
+                finished_at=now,
+            ) if answer_id in reused_results else AnalysisJobItem(job=job, answer_id=answer_id)
+            for answer_id in answer_ids
+        ])
+    return job
+
+
+def dispatch_analysis_job(job_id):
+    """남은 답안 수와 동시 실행 한도 중 작은 수만큼 작업자를 띄웁니다."""
+    pending_count = AnalysisJobItem.objects.filter(
+        job_id=job_id, status=AnalysisJobItem.Status.PENDING
+    ).count()
+    with _active_workers_lock:
+        running = _active_workers.get(job_id, 0)
+        worker_count = max(min(get_job_concurrency() - running, pending_count), 0)
+        if worker_count:
+            _active_workers[job_id] = running + worker_count
+    for _ in range(worker_count):
+        run_in_background(_run_job_worker, job_id)
+    if not pending_count:
+        _finalize_job(job_id)
+    return worker_count
+
+
+def _release_worker(job_id):
+    with _active_workers_lock:
+        remaining = _active_workers.get(job_id, 1) - 1
+        if remaining > 0:
+            _active_workers[job_id] = remaining
+        else:
+            _active_workers.pop(job_id, None)
+
+
+def _claim_next_items(job_id, limit=1):
+    """대기 중인 답안을 최대 limit개까지 원자적으로 선점합니다(여러 작업자·프로세스 공용)."""
+    candidate_ids = AnalysisJobItem.objects.filter(
+        job_id=job_id, status=AnalysisJobItem.Status.PENDING
+    ).order_by('id').values_list('id', flat=True)[:limit + 10]
+    claimed_ids = []
+    for item_id in candidate_ids:
+        claimed = AnalysisJobItem.objects.filter(
+            pk=item_id, status=AnalysisJobItem.Status.PENDING
+        ).update(
+            status=AnalysisJobItem.Status.RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            claimed_ids.append(item_id)
+            if len(claimed_ids) >= limit:
+                break
+    return list(AnalysisJobItem.objects.filter(pk__in=claimed_ids).order_by('id'))
+
+
+def get_job_pack_size(job):
+    """짧은 답안 묶음 분석 크기. 작업 옵션 pack_answers=false이면 한 답안씩 처리합니다."""
+    if job.options.get('pack_answers') is False:
+        return 1
+    return max(get_analysis_pack_size(), 1)
+
+
+def _fail_job(job_id, message):
+    AnalysisJob.objects.filter(pk=job_id).exclude(status=AnalysisJob.Status.COMPLETED).update(
+        status=AnalysisJob.Status.FAILED,
+        last_error=str(message)[:500],
+        finished_at=timezone.now(),
+    )
+
+
+def _finalize_job(job_id):
+    unfinished = AnalysisJobItem.objects.filter(
+        job_id=job_id,
+        status__in=[AnalysisJobItem.Status.PENDING, AnalysisJobItem.Status.RUNNING],
+    ).exists()
+    if not unfinished:
+        AnalysisJob.objects.filter(
+            pk=job_id, status__in=[AnalysisJob.Status.PENDING, AnalysisJob.Status.RUNNING]
+        ).update(status=AnalysisJob.Status.COMPLETED, finished_at=timezone.now())
+
+
+def _build_item_body(job, item):
+    return {
+        **job.options,
+        'answer_id': item.answer_id,
+        'work_name': job.work_name,
+        'batch_id': job.batch_id,
+    }
+
+
+def process_analysis_job_item(job, item):
+    """답안 하나를 api_process_db_row와 같은 로직으로 분석하고 상태 행을 갱신합니다."""
+    from .views.ai_views import execute_student_analysis
+
+    try:
+        outcome = execute_student_analysis(job.teacher, _build_item_body(job, item))
+    except Exception as exc:
+        outcome = exc
+    item_status = _apply_item_outcome(job, item, outcome)
+    time.sleep(_retry_backoff_seconds(item, outcome))
+    return item_status
+
+
+def process_analysis_job_items(job, items):
+    """여러 답안을 묶음 분석으로 처리합니다. 하나면 단일 분석과 같습니다."""
+    from .views.ai_views import execute_packed_student_analyses
+
+    if len(items) == 1:
+        return [process_analysis_job_item(job, items[0])]
+    try:
+        outcomes = execute_packed_student_analyses(job.teacher, [_build_item_body(job, item) for item in items])
+    except Exception as exc:
+        outcomes = [exc] * len(items)
+    item_statuses = [_apply_item_outcome(job, item, outcome) for item, outcome in zip(items, outcomes)]
+    # 묶음이 함께 과부하를 만났다면 답안마다가 아니라 한 번만 기다립니다.
+    time.sleep(max(_retry_backoff_seconds(item, outcome) for item, outcome in zip(items, outcomes)))
+    return item_statuses
+
+
+def _retry_backoff_seconds(item, outcome):
+    from .views.ai_views import AnalysisRequestError
+
+    if isinstance(outcome, AnalysisRequestError) and outcome.retryable and item.attempts < MAX_ITEM_ATTEMPTS:
+        return min(2 ** item.attempts, 30)
+    return 0
+
+
+def _apply_item_outcome(job, item, outcome):
+    """분석 결과(dict) 또는 예외를 답안 상태로 바꿔 저장합니다(재시도·건너뜀·작업 중단 판단 포함)."""
+    from .views.ai_views import AnalysisRequestError
+
+    item_status = AnalysisJobItem.Status.ERROR
+    message = ''
+    analysis_result_id = None
+    if isinstance(outcome, AnalysisRequestError):
+        message = outcome.payload.get('message', '')
+        if outcome.payload.get('status') == 'skipped':
+            item_status = AnalysisJobItem.Status.SKIPPED
+        elif outcome.stops_batch:
+            _fail_job(job.pk, message)
+        elif outcome.retryable and item.attempts < MAX_ITEM_ATTEMPTS:
+            item_status = AnalysisJobItem.Status.PENDING
+    elif isinstance(outcome, SystemConfig.DoesNotExist):
+        message = '관리자 페이지에서 API_KEY를 등록해주세요.'
+        _fail_job(job.pk, message)
+    elif isinstance(outcome, Exception):
+        message = str(outcome)
+        if item.attempts < MAX_ITEM_ATTEMPTS:
+            item_status = AnalysisJobItem.Status.PENDING
+    else:
+        item_status = AnalysisJobItem.Status.SUCCESS
+        analysis_result_id = outcome.get('analysis_result_id')
+
+    AnalysisJobItem.objects.filter(pk=item.pk).update(
+        status=item_status,
+        message=message[:500],
+        analysis_result_id=analysis_result_id,
+        finished_at=None if item_status == AnalysisJobItem.Status.PENDING else timezone.now(),
+    )
+    return item_status
+
+
+def _run_job_worker(job_id):
+    try:
+        now = timezone.now()
+        AnalysisJob.objects.filter(pk=job_id, status=AnalysisJob.Status.PENDING).update(
+            status=AnalysisJob.Status.RUNNING, started_at=now, heartbeat_at=now,
+        )
+        job = AnalysisJob.objects.select_related('teacher__school', 'teacher__subject').get(pk=job_id)
+        pack_size = get_job_pack_size(job)
+        # 일괄 분석 호출은 교사별 한도 안에서 다른 교사·화면 요청과 공평하게 슬롯을 나눠 씁니다.
+        with job_heartbeat(job_id), llm_caller(job.teacher_id, BATCH):
+            while True:
+                if AnalysisJob.objects.filter(pk=job_id, status=AnalysisJob.Status.FAILED).exists():
+                    break
+                items = _claim_next_items(job_id, pack_size)
+                if not items:
+                    break
+                process_analysis_job_items(job, items)
+                AnalysisJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now())
+        _finalize_job(job_id)
+    finally:
+        _release_worker(job_id)
+
+
+def resume_stalled_analysis_jobs(stale_seconds=None, job_ids=None):
+    """처리 신호가 끊긴 작업을 다시 띄웁니다(서버 재시작·작업자 중단 복구).
+
+    중단 시점에 처리 중이던 답안은 대기 상태로 되돌린 뒤 이어서 분석합니다.
+    """
+    stale_seconds = get_job_stale_seconds() if stale_seconds is None else stale_seconds
+    cutoff = timezone.now() - timedelta(seconds=stale_seconds)
+    resumed = []
+    stalled_jobs = AnalysisJob.objects.filter(
+        status__in=[AnalysisJob.Status.PENDING, AnalysisJob.Status.RUNNING],
+    ).exclude(heartbeat_at__gte=cutoff).exclude(heartbeat_at__isnull=True, created_at__gte=cutoff)
+    if job_ids is not None:
+        stalled_jobs = stalled_jobs.filter(pk__in=job_ids)
+    for job in stalled_jobs:
+        with _active_workers_lock:
+            if _active_workers.get(job.pk):
+                continue
+        AnalysisJobItem.objects.filter(
+            job=job, status=AnalysisJobItem.Status.RUNNING,
+        ).exclude(started_at__gte=cutoff).update(status=AnalysisJobItem.Status.PENDING)
+        AnalysisJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+        dispatch_analysis_job(job.pk)
+        resumed.append(job.pk)
+    return resumed
+
+
+def get_analysis_job_progress(job):
+    counts = {status: 0 for status in AnalysisJobItem.Status.values}
+    for row in job.items.values('status').annotate(count=Count('id')):
+        counts[row['status']] = row['count']
+    done_count = (
+        counts[AnalysisJobItem.Status.SUCCESS]
+        + counts[AnalysisJobItem.Status.SKIPPED]
+        + counts[AnalysisJobItem.Status.ERROR]
+    )
+    running_items = job.items.filter(
+        status=AnalysisJobItem.Status.RUNNING
+    ).select_related('answer__student')[:5]
+    recent_errors = job.items.filter(
+        status=AnalysisJobItem.Status.ERROR
+    ).select_related('answer__student').order_by('-finished_at')[:5]
+    return {
+        'job_id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'work_name': job.work_name,
+        'batch_id': job.batch_id,
+        'total': job.total_count,
+        'done': done_count,
+        'counts': counts,
+        'percent': round(done_count * 100 / job.total_count) if job.total_count else 100,
+        'current_names': [item.answer.student.name for item in running_items],
+        'errors': [
+            {'name': item.answer.student.name, 'message': item.message}
+            for item in recent_errors
+        ],
+        'last_error': job.last_error,
+        'is_finished': job.is_finished,
+        # 입력 토큰 중 OpenAI 프롬프트 캐시로 할인된 비율(공통 접두부 배치가 잘 되는지 확인용)
+        'prompt_cache': get_batch_prompt_cache_stats(job.activity_id, job.batch_id) if job.is_finished else None,
+    }
@@ -0,0 +1,172 @@
+"""복사 허용(개방형) 활동에서 거의 같은 답안을 묶어, 묶음마다 대표 답안 하나만 분석하도록 돕는 유사도 엔진.
+
+답안 본문을 글자 2·3-그램 어휘 전체를 열로 하는 희소 TF-IDF 벡터로 만들고,
+희소 행렬 곱을 블록 단위로 계산해 유사도가 기준 이상인 답안을 대표 답안에 묶습니다.
+파이썬 반복은 답안 수만큼만 돌고, 답안 쌍 비교는 모두 NumPy·SciPy 희소 행렬 연산이 처리합니다.
+"""
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from .models import AnalysisJob, Answer
+
+# 복사 허용 활동만 묶음 분석을 제안합니다(복사 금지 활동은 비슷한 답안이 드뭅니다).
+CLUSTERED_EXAM_MODES = ('OPEN_FREE',)
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+NGRAM_SIZES = (2, 3)
+# 한 번에 유사도를 계산하는 대표 후보 행 수(블록 × 답안 수 크기의 행렬만 메모리에 둡니다).
+SIMILARITY_BLOCK_ROWS = 256
+_HASH_MULTIPLIER = np.uint64(1_000_003)
+
+
+def get_similarity_threshold():
+    return float(getattr(settings, 'AI_DUPLICATE_SIMILARITY_THRESHOLD', DEFAULT_SIMILARITY_THRESHOLD))
+
+
+def supports_answer_clustering(activity):
+    return activity.exam_mode in CLUSTERED_EXAM_MODES
+
+
+def normalize_answer_text(text):
+    # 대소문자·띄어쓰기·줄바꿈 차이만 있는 답안은 같은 답안으로 봅니다.
+    return ' '.join((text or '').lower().split())
+
+
+def _ngram_ids(text):
+    # n-그램마다 64비트 다항식 해시를 씁니다. 버킷으로 접지 않으므로 서로 다른 n-그램이 한 열에 겹치지 않습니다.
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    parts = []
+    for size in NGRAM_SIZES:
+        count = len(codes) - size + 1
+        if count <= 0:
+            continue
+        hashes = np.full(count, size, dtype=np.uint64)
+        for offset in range(size):
+            hashes = hashes * _HASH_MULTIPLIER + codes[offset:offset + count]
+        parts.append(hashes)
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.uint64)
+
+
+def build_tfidf_matrix(texts):
+    """글자 n-그램 TF-IDF 희소 행렬(CSR, 행마다 L2 정규화, float32)을 만듭니다. 열은 실제로 나온 n-그램입니다."""
+    ngram_ids = [_ngram_ids(text) for text in texts]
+    rows = np.repeat(np.arange(len(texts)), [len(ids) for ids in ngram_ids])
+    vocabulary, cols = np.unique(np.concatenate(ngram_ids), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.float32), (rows, cols.ravel())),
+        shape=(len(texts), len(vocabulary)),
+    )
+    matrix.sum_duplicates()
+    matrix.data = np.log1p(matrix.data)
+
+    document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    matrix.data *= (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    row_norms = np.repeat(norms, np.diff(matrix.indptr))
+    np.divide(matrix.data, row_norms, out=matrix.data, where=row_norms > 0)
+    return matrix
+
+
+def find_near_duplicate_groups(texts, threshold=None):
+    """답안마다 대표 답안의 위치를 담은 배열을 돌려줍니다(빈 답안은 -1).
+
+    앞선 답안부터 대표가 되고, 아직 묶이지 않은 답안 중 대표와의 코사인 유사도가 기준 이상인 답안을
+    그 묶음에 넣습니다. 그래서 모든 구성원은 대표 답안과 직접 비슷합니다(연쇄로 멀어지지 않음).
+    본문이 완전히 같은 답안은 행렬 계산 전에 먼저 합칩니다.
+    """
+    threshold = get_similarity_threshold() if threshold is None else threshold
+    normalized = [normalize_answer_text(text) for text in texts]
+    labels = np.full(len(texts), -1, dtype=np.int64)
+
+    first_positions = {}
+    for position, text in enumerate(normalized):
+        if text:
+            labels[position] = first_positions.setdefault(text, position)
+    unique_positions = np.array(list(first_positions.values()), dtype=np.int64)
+    if not unique_positions.size:
+        return labels
+
+    matrix = build_tfidf_matrix([normalized[position] for position in unique_positions])
+    leaders = np.full(len(unique_positions), -1, dtype=np.int64)
+    for start in range(0, len(unique_positions), SIMILARITY_BLOCK_ROWS):
+        rows = np.arange(start, min(start + SIMILARITY_BLOCK_ROWS, len(unique_positions)))
+        rows = rows[leaders[rows] < 0]
+        if not rows.size:
+            continue
+        open_columns = np.flatnonzero(leaders < 0)
+        similarities = (matrix[rows] @ matrix[open_columns].T).toarray()
+        for local_row, row in enumerate(rows):
+            if leaders[row] >= 0:
+                continue
+            candidates = open_columns[similarities[local_row] >= threshold]
+            leaders[candidates[leaders[candidates] < 0]] = row
+            leaders[row] = row
+
+    representative_of_unique = unique_positions[leaders]
+    has_text = labels >= 0
+    position_to_unique = np.full(len(texts), -1, dtype=np.int64)
+    position_to_unique[unique_positions] = np.arange(len(unique_positions))
+    labels[has_text] = representative_of_unique[position_to_unique[labels[has_text]]]
+    return labels
+
+
+def cluster_answers(answers, threshold=None):
+    """{답안 id: 대표 답안 id}. 내용이 없는 답안은 빠지고, 묶이지 않은 답안은 자기 자신이 대표입니다."""
+    answers = list(answers)
+    labels = find_near_duplicate_groups([answer.display_content for answer in answers], threshold)
+    return {
+        answer.id: answers[label].id
+        for answer, label in zip(answers, labels)
+        if label >= 0
+    }
+
+
+def select_cluster_representatives(activity, answer_ids, threshold=None):
+    """(분석할 대표 답안 id 목록, {대표에 묶여 건너뛰는 답안 id: 대표 답안 id})를 돌려줍니다."""
+    answers = Answer.objects.filter(
+        question__activity=activity, id__in=answer_ids
+    ).select_related('question__activity').order_by('student__grade', 'student__class_no', 'student__number', 'id')
+    representatives = cluster_answers(answers, threshold)
+    skipped = {
+        answer_id: representative_id
+        for answer_id, representative_id in representatives.items()
+        if answer_id != representative_id
+    }
+    return [answer_id for answer_id in answer_ids if answer_id not in skipped], skipped
+
+
+def get_saved_representative_maps(activity):
+    """대표 답안만 분석한 작업의 대응표를 요청 순서대로 {(작업명, batch_id): {건너뛴 답안 id: 대표 답안 id}}로 돌려줍니다.
+
+    결과 화면은 작업을 만들 때 고른 대표를 그대로 써야 하므로 답안을 다시 묶지 않습니다.
+    """
+    saved_maps = {}
+    jobs = AnalysisJob.objects.filter(activity=activity).order_by('created_at').values_list(
+        'work_name', 'batch_id', 'representative_map'
+    )
+    for work_name, batch_id, representative_map in jobs:
+        if representative_map:
+            saved_maps.setdefault((work_name, batch_id), {}).update(
+                {int(answer_id): representative_id for answer_id, representative_id in representative_map.items()}
+            )
+    return saved_maps
+
+
+def describe_answer_clusters(representative_map, student_names):
+    """화면 표시용 {답안 id: 묶음 정보}. representative_map은 {건너뛴 답안 id: 대표 답안 id}입니다."""
+    members = {}
+    for answer_id, representative_id in representative_map.items():
+        members.setdefault(representative_id, [representative_id]).append(answer_id)
+
+    clusters = {}
+    for number, (representative_id, member_ids) in enumerate(sorted(members.items()), 1):
+        for answer_id in member_ids:
+            clusters[answer_id] = {
+                'number': number,
+                'size': len(member_ids),
+                'representative_id': representative_id,
+                'representative_name': student_names.get(representative_id, ''),
+                'is_representative': answer_id == representative_id,
+            }
+    return clusters
@@ -0,0 +1,41 @@
+"""요청 스레드를 막지 않고 AI 관련 작업을 실행하는 프로세스 내 작업 풀."""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKGROUND_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_background_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AI_BACKGROUND_WORKERS', DEFAULT_BACKGROUND_WORKERS),
+                thread_name_prefix='ingrid-ai',
+            )
+        return _executor
+
+
+def run_in_background(func, *args, **kwargs):
+    """작업 스레드마다 DB 연결을 정리하고, 예외는 로그로만 남깁니다."""
+
+    def runner():
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            logger.exception('백그라운드 작업 실패: %s', getattr(func, '__name__', func))
+        finally:
+            close_old_connections()
+
+    return get_background_executor().submit(runner)
@@ -0,0 +1,91 @@
+"""마감 연장 뒤 같은 작업명으로 다시 분석할 때, 바뀐 답안만 모델에 보내고 나머지는 이전 결과를 이어 쓰는 도구."""
+
+import hashlib
+
+from .models import AnalysisResult, Answer
+
+
+def answer_content_hash(content):
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+
+def is_answer_changed(answer, previous_result):
+    """이전 결과 이후 답안이 바뀌었는지 판단합니다.
+
+    해시가 있으면 본문만 비교하고(교사 메모·결시 사유 저장이나 AI 결과 기록으로 바뀐 updated_at은 무시),
+    해시가 없는 예전 결과는 updated_at이 결과 생성 이후면 바뀐 것으로 봅니다.
+    """
+    if previous_result.source_hash:
+        return answer_content_hash(answer.display_content) != previous_result.source_hash
+    return answer.updated_at is None or answer.updated_at > previous_result.created_at
+
+
+def result_settings_match(previous_result, result_settings):
+    """이전 결과가 이번 요청과 같은 설정(저장되는 지시문·모델·온도)으로 만들어졌는지 확인합니다."""
+    if result_settings is None:
+        return True
+    return (
+        previous_result.prompt_system == result_settings['prompt_system']
+        and previous_result.ai_model == result_settings['ai_model']
+        and abs(previous_result.temperature - result_settings['temperature']) < 1e-6
+    )
+
+
+def split_changed_answers(activity, work_name, answer_ids, result_settings=None):
+    """(다시 분석할 답안 id 목록, {그대로인 답안 id: 이어 쓸 최신 AnalysisResult})를 돌려줍니다.
+
+    result_settings({'prompt_system', 'ai_model', 'temperature'})를 주면 답안이 그대로여도
+    이전 결과가 다른 설정으로 만들어졌다면 다시 분석합니다.
+    """
+    answers = Answer.objects.filter(question__activity=activity, id__in=answer_ids).select_related('question__activity')
+    latest_results = {}
+    previous_results = AnalysisResult.objects.filter(
+        work_name=work_name, answer_id__in=answer_ids
+    ).order_by('answer_id', '-created_at')
+    for result in previous_results:
+        latest_results.setdefault(result.answer_id, result)
+
+    changed_ids = []
+    unchanged_results = {}
+    for answer in answers:
+        previous_result = latest_results.get(answer.id)
+        if (
+            previous_result is None
+            or is_answer_changed(answer, previous_result)
+            or not result_settings_match(previous_result, result_settings)
+        ):
+            changed_ids.append(answer.id)
+        else:
+            unchanged_results[answer.id] = previous_result
+    return changed_ids, unchanged_results
+
+
+def copy_forward_results(unchanged_results, batch_id):
+    """이전 결과를 새 batch_id로 복사합니다(이미 복사된 답안은 건너뜀). {답안 id: 새 batch의 결과 id}"""
+    if not unchanged_results:
+        return {}
+    work_names = {result.work_name for result in unchanged_results.values()}
+    existing_answer_ids = set(
+        AnalysisResult.objects.filter(
+            batch_id=batch_id, work_name__in=work_names, answer_id__in=list(unchanged_results)
+        ).values_list('answer_id', flat=True)
+    )
+    AnalysisResult.objects.bulk_create([
+        AnalysisResult(
+            answer_id=answer_id,
+            result_content=result.result_content,
+            prompt_system=result.prompt_system,
+            temperature=result.temperature,
+            ai_model=result.ai_model,
+            work_name=result.work_name,
+            batch_id=batch_id,
+            source_hash=result.source_hash,
+        )
+        for answer_id, result in unchanged_results.items()
+        if answer_id not in existing_answer_ids
+    ])
+    return dict(
+        AnalysisResult.objects.filter(
+            batch_id=batch_id, work_name__in=work_names, answer_id__in=list(unchanged_results)
+        ).order_by('created_at').values_list('answer_id', 'id')
+    )
@@ -0,0 +1,109 @@
+"""브라우저 재시도(시간 초과 후 다시 보내기)가 진행 중이거나 끝난 분석 호출에 붙도록 하는 요청 키 저장소."""
+
+import asyncio
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import AIRequestIdempotency
+
+DEFAULT_IDEMPOTENCY_TTL_SECONDS = 30 * 60
+DEFAULT_IDEMPOTENCY_WAIT_SECONDS = 150
+# 진행 중 표시가 이보다 오래 갱신되지 않으면 처리하던 프로세스가 중단된 것으로 보고 넘겨받습니다.
+DEFAULT_IDEMPOTENCY_STALE_SECONDS = 300
+POLL_INTERVAL_SECONDS = 1
+MAX_KEY_LENGTH = 100
+
+
+def get_idempotency_ttl_seconds():
+    return int(getattr(settings, 'AI_IDEMPOTENCY_TTL_SECONDS', DEFAULT_IDEMPOTENCY_TTL_SECONDS))
+
+
+def get_idempotency_wait_seconds():
+    return int(getattr(settings, 'AI_IDEMPOTENCY_WAIT_SECONDS', DEFAULT_IDEMPOTENCY_WAIT_SECONDS))
+
+
+def get_idempotency_stale_seconds():
+    return int(getattr(settings, 'AI_IDEMPOTENCY_STALE_SECONDS', DEFAULT_IDEMPOTENCY_STALE_SECONDS))
+
+
+def get_request_idempotency_key(request, body):
+    """Idempotency-Key 헤더 또는 본문의 idempotency_key. 없으면 중복 방지 없이 처리합니다."""
+    key = request.headers.get('Idempotency-Key') or body.get('idempotency_key') or ''
+    return str(key).strip()[:MAX_KEY_LENGTH]
+
+
+def claim_idempotency_key(teacher, key):
+    """(기록, 직접 처리 여부)를 돌려줍니다.
+
+    처음 온 요청이거나 앞선 시도가 실패·중단됐으면 이 요청이 처리하고(True),
+    같은 키의 호출이 진행 중이거나 끝났으면 그 결과를 기다려 씁니다(False).
+    """
+    prune_idempotency_keys()
+    try:
+        with transaction.atomic():
+            record = AIRequestIdempotency.objects.create(teacher=teacher, key=key)
+        return record, True
+    except IntegrityError:
+        record = AIRequestIdempotency.objects.get(teacher=teacher, key=key)
+
+    stale_before = timezone.now() - timedelta(seconds=get_idempotency_stale_seconds())
+    is_stale = record.status == AIRequestIdempotency.Status.IN_PROGRESS and record.updated_at < stale_before
+    if record.status == AIRequestIdempotency.Status.FAILED or is_stale:
+        # 여러 재시도가 동시에 와도 상태를 바꾼 한 요청만 다시 호출합니다.
+        taken_over = AIRequestIdempotency.objects.filter(
+            pk=record.pk, status=record.status, updated_at=record.updated_at
+        ).update(status=AIRequestIdempotency.Status.IN_PROGRESS, response_body=None, updated_at=timezone.now())
+        if taken_over:
+            record.refresh_from_db()
+            return record, True
+    return record, False
+
+
+def complete_idempotency_key(record, response_body):
+    if record is None:
+        return
+    AIRequestIdempotency.objects.filter(pk=record.pk).update(
+        status=AIRequestIdempotency.Status.COMPLETED, response_body=response_body, updated_at=timezone.now()
+    )
+
+
+def fail_idempotency_key(record):
+    # 실패한 요청은 결과를 보관하지 않고, 다음 재시도가 다시 호출할 수 있게 둡니다.
+    if record is None:
+        return
+    AIRequestIdempotency.objects.filter(
+        pk=record.pk, status=AIRequestIdempotency.Status.IN_PROGRESS
+    ).update(status=AIRequestIdempotency.Status.FAILED, updated_at=timezone.now())
+
+
+def _get_finished_response(record_id):
+    """완료면 (True, 응답), 실패면 (True, None), 아직 진행 중이면 (False, None)."""
+    record = AIRequestIdempotency.objects.filter(pk=record_id).only('status', 'response_body').first()
+    if record is None or record.status == AIRequestIdempotency.Status.FAILED:
+        return True, None
+    if record.status == AIRequestIdempotency.Status.COMPLETED:
+        return True, record.response_body
+    return False, None
+
+
+async def await_idempotent_response(record, timeout=None):
+    """같은 키로 진행 중인 호출이 끝나기를 기다려 (끝났는지, 응답)을 돌려줍니다.
+
+    완료면 (True, 응답), 실패면 (True, None), 기다리는 시간이 지나면 (False, None)입니다.
+    """
+    deadline = time.monotonic() + (get_idempotency_wait_seconds() if timeout is None else timeout)
+    while True:
+        finished, response_body = await sync_to_async(_get_finished_response)(record.pk)
+        if finished or time.monotonic() >= deadline:
+            return finished, response_body
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+
+def prune_idempotency_keys():
+    cutoff = timezone.now() - timedelta(seconds=get_idempotency_ttl_seconds())
+    AIRequestIdempotency.objects.filter(created_at__lt=cutoff).delete()
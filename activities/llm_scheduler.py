@@ -0,0 +1,222 @@
+"""여러 교사가 같은 API 키·한도를 나눠 쓸 때 LLM 동시 호출 슬롯을 공평하게 배분하는 스케줄러.
+
+호출부는 llm_caller(교사 id, 구분)로 누가 어떤 성격의 호출을 하는지 표시하고,
+llm_request·allm_request는 실제 HTTP 호출 동안 슬롯 하나를 잡습니다.
+
+- 교사 한 명의 일괄 분석(batch)은 교사별 동시 호출 한도를 넘지 못합니다.
+- 대기 중인 호출은 교사별 가중 공정 대기열(시작 시각 공정 큐잉) 순서로 슬롯을 받습니다.
+- 답안 하나를 바로 보는 요청(interactive)은 일괄 분석보다 먼저 받고, 일괄 분석이 쓸 수 없는
+  예약 슬롯이 있어 긴 일괄 작업 중에도 곧바로 시작합니다.
+
+한도는 워커 프로세스 단위입니다(llm_transport의 호출 한도와 같음).
+"""
+
+import asyncio
+import itertools
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+DEFAULT_MAX_CONCURRENT_CALLS = 16
+DEFAULT_MAX_CONCURRENT_CALLS_PER_TEACHER = 4
+DEFAULT_INTERACTIVE_RESERVED_CALLS = 2
+
+_current_caller = ContextVar('llm_caller', default=None)
+_slot_held = ContextVar('llm_slot_held', default=False)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_teacher_weight(teacher_id):
+    weights = getattr(settings, 'LLM_TEACHER_WEIGHTS', {}) or {}
+    return max(float(weights.get(teacher_id, 1)), 0.01)
+
+
+class _Waiter:
+    __slots__ = ('teacher_id', 'lane', 'start_tag', 'sequence', 'wake')
+
+    def __init__(self, teacher_id, lane, start_tag, sequence, wake):
+        self.teacher_id = teacher_id
+        self.lane = lane
+        self.start_tag = start_tag
+        self.sequence = sequence
+        self.wake = wake
+
+
+class FairShareScheduler:
+    def __init__(self, capacity, per_teacher_limit, interactive_reserved=0):
+        self.capacity = max(int(capacity), 1)
+        self.per_teacher_limit = max(int(per_teacher_limit), 1)
+        self.batch_capacity = max(self.capacity - max(int(interactive_reserved), 0), 1)
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._running_total = 0
+        self._running_batch = 0
+        self._running_batch_by_teacher = Counter()
+        # 교사별로 마지막에 줄 세운 호출의 가상 종료 시각. 토큰을 많이 쓴 교사일수록 뒤로 밀립니다.
+        self._finish_tags = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+
+    def _enqueue(self, teacher_id, lane, cost, wake):
+        with self._lock:
+            start_tag = max(self._virtual_time, self._finish_tags.get(teacher_id, 0.0))
+            self._finish_tags[teacher_id] = start_tag + max(cost, 1) / get_teacher_weight(teacher_id)
+            waiter = _Waiter(teacher_id, lane, start_tag, next(self._sequence), wake)
+            self._waiters.append(waiter)
+            granted = self._dispatch_locked()
+        for granted_waiter in granted:
+            granted_waiter.wake()
+        return waiter
+
+    def _can_run(self, waiter):
+        if waiter.lane == INTERACTIVE:
+            return True
+        return (
+            self._running_batch < self.batch_capacity
+            and self._running_batch_by_teacher[waiter.teacher_id] < self.per_teacher_limit
+        )
+
+    def _dispatch_locked(self):
+        granted = []
+        while self._running_total < self.capacity:
+            eligible = [waiter for waiter in self._waiters if self._can_run(waiter)]
+            if not eligible:
+                break
+            waiter = min(eligible, key=lambda item: (item.lane != INTERACTIVE, item.start_tag, item.sequence))
+            self._waiters.remove(waiter)
+            self._running_total += 1
+            if waiter.lane != INTERACTIVE:
+                self._running_batch += 1
+                self._running_batch_by_teacher[waiter.teacher_id] += 1
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            granted.append(waiter)
+        waiting_teachers = {waiter.teacher_id for waiter in self._waiters}
+        for teacher_id in [
+            teacher_id for teacher_id, finish_tag in self._finish_tags.items()
+            if finish_tag <= self._virtual_time and teacher_id not in waiting_teachers
+        ]:
+            del self._finish_tags[teacher_id]
+        return granted
+
+    def release(self, waiter):
+        with self._lock:
+            self._running_total -= 1
+            if waiter.lane != INTERACTIVE:
+                self._running_batch -= 1
+                self._running_batch_by_teacher[waiter.teacher_id] -= 1
+                if self._running_batch_by_teacher[waiter.teacher_id] <= 0:
+                    del self._running_batch_by_teacher[waiter.teacher_id]
+            granted = self._dispatch_locked()
+        for granted_waiter in granted:
+            granted_waiter.wake()
+
+    def _cancel(self, waiter):
+        # 기다리다 취소된 호출은 줄에서 빼고, 이미 슬롯을 받았다면 돌려줍니다.
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return
+        self.release(waiter)
+
+    def acquire(self, teacher_id, lane, cost=1):
+        granted = threading.Event()
+        waiter = self._enqueue(teacher_id, lane, cost, granted.set)
+        granted.wait()
+        return waiter
+
+    async def aacquire(self, teacher_id, lane, cost=1):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def resolve():
+            if not granted.done():
+                granted.set_result(None)
+
+        waiter = self._enqueue(teacher_id, lane, cost, lambda: loop.call_soon_threadsafe(resolve))
+        try:
+            await granted
+        except asyncio.CancelledError:
+            self._cancel(waiter)
+            raise
+        return waiter
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'running': self._running_total,
+                'running_batch': self._running_batch,
+                'waiting': len(self._waiters),
+            }
+
+
+def get_llm_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairShareScheduler(
+                capacity=getattr(settings, 'LLM_MAX_CONCURRENT_CALLS', DEFAULT_MAX_CONCURRENT_CALLS),
+                per_teacher_limit=getattr(
+                    settings, 'LLM_MAX_CONCURRENT_CALLS_PER_TEACHER', DEFAULT_MAX_CONCURRENT_CALLS_PER_TEACHER
+                ),
+                interactive_reserved=getattr(
+                    settings, 'LLM_INTERACTIVE_RESERVED_CALLS', DEFAULT_INTERACTIVE_RESERVED_CALLS
+                ),
+            )
+        return _scheduler
+
+
+@contextmanager
+def llm_caller(teacher_id, lane):
+    """이 안에서 일어나는 LLM 호출을 teacher_id의 lane(INTERACTIVE·BATCH) 호출로 줄 세웁니다."""
+    token = _current_caller.set((teacher_id, lane))
+    try:
+        yield
+    finally:
+        _current_caller.reset(token)
+
+
+def _should_schedule():
+    # 호출자 표시가 없는 호출(관리 명령·계정 화면 등)과 이미 슬롯을 잡은 안쪽 호출은 그대로 통과합니다.
+    return _current_caller.get() is not None and not _slot_held.get()
+
+
+@contextmanager
+def llm_slot(cost=1):
+    """현재 호출자 몫의 동시 호출 슬롯을 하나 잡습니다. cost는 공정 배분에 쓰는 예상 토큰 수입니다."""
+    if not _should_schedule():
+        yield
+        return
+    teacher_id, lane = _current_caller.get()
+    scheduler = get_llm_scheduler()
+    waiter = scheduler.acquire(teacher_id, lane, cost)
+    token = _slot_held.set(True)
+    try:
+        yield
+    finally:
+        _slot_held.reset(token)
+        scheduler.release(waiter)
+
+
+@asynccontextmanager
+async def allm_slot(cost=1):
+    """llm_slot의 비동기 버전입니다. 기다리는 동안 이벤트 루프를 막지 않습니다."""
+    if not _should_schedule():
+        yield
+        return
+    teacher_id, lane = _current_caller.get()
+    scheduler = get_llm_scheduler()
+    waiter = await scheduler.aacquire(teacher_id, lane, cost)
+    token = _slot_held.set(True)
+    try:
+        yield
+    finally:
+        _slot_held.reset(token)
+        scheduler.release(waiter)
@@ -0,0 +1,438 @@
+"""OpenAI·Gemini·Anthropic 호출이 공유하는 프로세스 단위 keep-alive HTTP 연결 풀과 호출 한도 관리.
+
+동기 뷰·작업 스레드는 requests 세션(llm_request)을, ASGI 비동기 뷰는 httpx.AsyncClient(allm_request)를 씁니다.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from contextlib import AsyncExitStack, ExitStack
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from .llm_scheduler import allm_slot, llm_slot
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_ASYNC_MAX_CONNECTIONS = 100
+DEFAULT_MAX_ATTEMPTS = 4
+MAX_BACKOFF_SECONDS = 30
+# 제공자가 요청을 처리하지 않았다고 확실한 응답만 다시 보냅니다. 5xx·시간 초과는 이미 처리(과금)됐을 수 있어 호출부에 맡깁니다.
+RETRYABLE_STATUS_CODES = {429}
+# 연결을 맺기 전(요청 본문을 보내기 전)에 실패한 경우만 비동기 호출에서 다시 시도합니다.
+ASYNC_PRE_SEND_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# 키 하나당 분당 요청 수(rpm)·토큰 수(tpm). 설정 LLM_RATE_LIMITS로 제공자별 덮어쓰기 가능.
+DEFAULT_RATE_LIMITS = {
+    'openai': {'rpm': 500, 'tpm': 200_000},
+    'gemini': {'rpm': 300, 'tpm': 1_000_000},
+    'anthropic': {'rpm': 50, 'tpm': 40_000},
+    'default': {'rpm': 60, 'tpm': 100_000},
+}
+
+# 호스트별로 세션을 나눠 한 제공자의 느린 응답이 다른 제공자의 연결을 붙잡지 않게 합니다.
+PROVIDER_HOSTS = {
+    'api.openai.com': 'openai',
+    'generativelanguage.googleapis.com': 'gemini',
+    'api.anthropic.com': 'anthropic',
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+# httpx.AsyncClient는 만든 이벤트 루프 밖에서 쓸 수 없으므로 루프마다 따로 둡니다.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_llm_pool_maxsize():
+    # 작업 풀의 스레드 수보다 풀이 작으면 남는 스레드가 매번 새 연결을 맺습니다.
+    return max(
+        int(getattr(settings, 'LLM_HTTP_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)),
+        int(getattr(settings, 'AI_BACKGROUND_WORKERS', 1)),
+    )
+
+
+def get_llm_timeout(read_timeout=None):
+    connect_timeout = getattr(settings, 'LLM_HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)
+    if read_timeout is None:
+        read_timeout = getattr(settings, 'LLM_HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)
+    return (connect_timeout, read_timeout)
+
+
+def provider_for_url(url):
+    return PROVIDER_HOSTS.get(urlsplit(url).hostname or '', 'default')
+
+
+def _build_session():
+    session = requests.Session()
+    # 어댑터 자체는 재시도하지 않습니다. llm_request가 429와 연결 전 실패만 골라 다시 보내고,
+    # 보낸 뒤의 실패(5xx·읽기 시간 초과·연결 끊김)는 과금이 두 번 될 수 있어 호출부(분석 작업 계층)에 맡깁니다.
+    adapter = HTTPAdapter(
+        pool_connections=int(getattr(settings, 'LLM_HTTP_POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS)),
+        pool_maxsize=get_llm_pool_maxsize(),
+        max_retries=0,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_llm_session(provider):
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = _sessions[provider] = _build_session()
+        return session
+
+
+def llm_post(url, *, timeout=None, **kwargs):
+    """requests.post와 같은 인자로 호출하되, 제공자별 연결 풀을 재사용합니다.
+
+    timeout은 읽기 제한(초)만 받으며 연결 제한은 설정값을 따릅니다.
+    """
+    session = get_llm_session(provider_for_url(url))
+    return session.post(url, timeout=get_llm_timeout(timeout), **kwargs)
+
+
+async def _close_clients_on_loop_shutdown(loop_ref, clients):
+    # 루프가 끝날 때(asyncio.run·async_to_sync의 shutdown_asyncgens) 이 제너레이터가 닫히며 클라이언트 연결도 닫습니다.
+    try:
+        yield
+    finally:
+        with _sessions_lock:
+            loop = loop_ref()
+            if loop is not None and _async_clients.get(loop, (None,))[0] is clients:
+                del _async_clients[loop]
+            closing = list(clients.values())
+            clients.clear()
+        for client in closing:
+            await client.aclose()
+
+
+async def get_async_llm_client(provider):
+    """현재 이벤트 루프의 제공자별 httpx.AsyncClient. 스레드 없이 많은 호출을 동시에 기다릴 수 있습니다.
+
+    WSGI에서는 비동기 뷰마다 새 루프가 생기므로, 루프가 끝날 때 그 루프의 클라이언트를 함께 닫습니다.
+    """
+    loop = asyncio.get_running_loop()
+    with _sessions_lock:
+        entry = _async_clients.get(loop)
+        closer = None
+        if entry is None:
+            clients = {}
+            closer = _close_clients_on_loop_shutdown(weakref.ref(loop), clients)
+            _async_clients[loop] = (clients, closer)
+        else:
+            clients = entry[0]
+        client = clients.get(provider)
+        if client is None:
+            connect_timeout, read_timeout = get_llm_timeout()
+            client = clients[provider] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=int(getattr(settings, 'LLM_ASYNC_MAX_CONNECTIONS', DEFAULT_ASYNC_MAX_CONNECTIONS)),
+                    max_keepalive_connections=get_llm_pool_maxsize(),
+                ),
+            )
+    if closer is not None:
+        # 첫 단계까지 진행해야 루프가 이 제너레이터를 종료 대상으로 등록합니다.
+        await closer.__anext__()
+    return client
+
+
+async def allm_post(url, *, timeout=None, stream=False, **kwargs):
+    """llm_post의 비동기 버전입니다. stream=True이면 본문을 읽지 않은 응답을 돌려주므로 호출부가 aclose()합니다."""
+    client = await get_async_llm_client(provider_for_url(url))
+    connect_timeout, read_timeout = get_llm_timeout(timeout)
+    request = client.build_request(
+        'POST', url, timeout=httpx.Timeout(read_timeout, connect=connect_timeout), **kwargs
+    )
+    return await client.send(request, stream=stream)
+
+
+def close_llm_sessions():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def split_api_keys(value):
+    """쉼표로 여러 개 등록된 API 키를 목록으로 나눕니다."""
+    if isinstance(value, (list, tuple)):
+        return [key for key in value if key]
+    return [key.strip() for key in str(value or '').split(',') if key.strip()]
+
+
+class TokenBucket:
+    """분당 한도를 초당 보충량으로 바꿔 쓰는 토큰 버킷입니다(스레드 안전)."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_per_second = float(per_minute) / 60
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        with self.lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                return 0.0
+            return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount):
+        with self.lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+
+class _KeyState:
+    def __init__(self, limits):
+        self.requests = TokenBucket(limits['rpm'])
+        self.tokens = TokenBucket(limits['tpm'])
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+
+
+_key_states = {}
+_key_states_lock = threading.Lock()
+
+
+def get_rate_limits(provider):
+    limits = dict(DEFAULT_RATE_LIMITS.get(provider, DEFAULT_RATE_LIMITS['default']))
+    limits.update((getattr(settings, 'LLM_RATE_LIMITS', {}) or {}).get(provider, {}))
+    return limits
+
+
+def _get_key_state(provider, api_key):
+    with _key_states_lock:
+        state = _key_states.get((provider, api_key))
+        if state is None:
+            state = _key_states[(provider, api_key)] = _KeyState(get_rate_limits(provider))
+        return state
+
+
+def _key_wait_time(state, estimated_tokens):
+    return max(
+        state.cooldown_until - time.monotonic(),
+        state.requests.wait_time(1),
+        state.tokens.wait_time(estimated_tokens),
+        0.0,
+    )
+
+
+def _pick_api_key(provider, api_keys, estimated_tokens):
+    """가장 빨리 쓸 수 있고 진행 중인 요청이 적은 키를 고릅니다. 바로 쓸 수 있으면(대기 0) 한도를 차감합니다."""
+    candidates = []
+    for api_key in api_keys:
+        state = _get_key_state(provider, api_key)
+        candidates.append((_key_wait_time(state, estimated_tokens), state.in_flight, random.random(), api_key, state))
+    wait_seconds, _, _, api_key, state = min(candidates)
+    if wait_seconds <= 0:
+        with _key_states_lock:
+            state.in_flight += 1
+        state.requests.consume(1)
+        state.tokens.consume(estimated_tokens)
+    return wait_seconds, api_key, state
+
+
+def acquire_api_key(provider, api_keys, estimated_tokens):
+    """쓸 수 있는 키가 생길 때까지 기다렸다가 (키, 상태)를 돌려줍니다."""
+    while True:
+        wait_seconds, api_key, state = _pick_api_key(provider, api_keys, estimated_tokens)
+        if wait_seconds <= 0:
+            return api_key, state
+        time.sleep(min(wait_seconds, MAX_BACKOFF_SECONDS))
+
+
+async def aacquire_api_key(provider, api_keys, estimated_tokens):
+    """acquire_api_key의 비동기 버전입니다. 기다리는 동안 이벤트 루프를 막지 않습니다."""
+    while True:
+        wait_seconds, api_key, state = _pick_api_key(provider, api_keys, estimated_tokens)
+        if wait_seconds <= 0:
+            return api_key, state
+        await asyncio.sleep(min(wait_seconds, MAX_BACKOFF_SECONDS))
+
+
+def _release_api_key(state):
+    with _key_states_lock:
+        state.in_flight = max(state.in_flight - 1, 0)
+
+
+def estimate_request_tokens(payload):
+    """요청 본문 길이로 입력 토큰을 어림하고 최대 출력 토큰을 더합니다(한도 차감용)."""
+    prompt_chars = len(json.dumps(payload or {}, ensure_ascii=False))
+    max_output = (payload or {}).get('max_tokens') or (payload or {}).get('max_output_tokens') or 0
+    return prompt_chars // 2 + int(max_output)
+
+
+def get_retry_after_seconds(response, attempt):
+    """Retry-After(초·밀리초) 헤더를 우선하고, 없으면 지수 백오프에 지터를 섞습니다."""
+    headers = getattr(response, 'headers', None) or {}
+    for header_name, scale in (('retry-after-ms', 0.001), ('Retry-After', 1)):
+        value = headers.get(header_name)
+        if value:
+            try:
+                return min(float(value) * scale, MAX_BACKOFF_SECONDS)
+            except ValueError:
+                continue
+    return random.uniform(0, min(2 ** attempt, MAX_BACKOFF_SECONDS))
+
+
+def _failed_before_send(exc):
+    """연결을 맺지 못해 요청이 제공자에 닿지 않은 실패인지 판단합니다."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _apply_api_key(provider, api_key, headers, params):
+    headers = dict(headers or {})
+    params = dict(params or {})
+    if provider == 'anthropic':
+        headers['x-api-key'] = api_key
+    elif provider == 'gemini':
+        params['key'] = api_key
+    else:
+        headers['Authorization'] = f'Bearer {api_key}'
+    return headers, params
+
+
+def _release_when_closed(response, held):
+    # 스트림 응답은 본문을 다 읽고 닫을 때까지 슬롯과 키의 진행 중 수를 붙잡아 둡니다.
+    close = response.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            held.close()
+
+    response.close = close_and_release
+
+
+def _arelease_when_closed(response, held):
+    # httpx는 스트림을 끝까지 읽으면 스스로 aclose()하므로, 다 읽거나 호출부가 닫을 때 풀립니다.
+    aclose = response.aclose
+
+    async def aclose_and_release():
+        try:
+            await aclose()
+        finally:
+            await held.aclose()
+
+    response.aclose = aclose_and_release
+
+
+def llm_request(url, *, api_keys, headers=None, json=None, timeout=None, stream=False, estimated_tokens=None,
+                max_attempts=None):
+    """한도 관리·재시도·키 순환을 거쳐 LLM API에 POST합니다.
+
+    HTTP 호출 동안에는 llm_scheduler의 공정 배분 슬롯을 잡습니다(키 한도·백오프 대기 중에는 잡지 않음).
+    stream=True이면 슬롯과 키의 진행 중 수는 호출부가 응답을 닫을 때 놓습니다.
+
+    url과 headers에는 키를 넣지 않습니다. 제공자 방식(Bearer·x-api-key·?key=)에 맞춰 여기서 넣습니다.
+    429와 연결을 맺기 전 실패만 Retry-After 또는 지터 백오프 뒤 다른 키로 다시 시도하고,
+    횟수를 다 쓰면 마지막 응답을 그대로 돌려줍니다(호출부의 기존 오류 처리 유지).
+    5xx·읽기 시간 초과·전송 뒤 연결 끊김은 제공자가 이미 처리했을 수 있으므로 다시 보내지 않습니다.
+    """
+    api_keys = split_api_keys(api_keys)
+    if not api_keys:
+        raise ValueError('API 키가 없습니다.')
+    provider = provider_for_url(url)
+    estimated_tokens = estimate_request_tokens(json) if estimated_tokens is None else estimated_tokens
+    max_attempts = max_attempts or int(getattr(settings, 'LLM_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+
+    for attempt in range(max_attempts):
+        # 키 한도가 풀리길 기다리는 동안에는 공정 배분 슬롯을 잡지 않습니다(다른 교사의 호출을 막지 않도록).
+        api_key, state = acquire_api_key(provider, api_keys, estimated_tokens)
+        held = ExitStack()
+        try:
+            held.callback(_release_api_key, state)
+            held.enter_context(llm_slot(estimated_tokens))
+            request_headers, params = _apply_api_key(provider, api_key, headers, None)
+            response = llm_post(
+                url, headers=request_headers, params=params or None, json=json, timeout=timeout,
+                stream=stream,
+            )
+        except requests.ConnectionError as exc:
+            held.close()
+            if not _failed_before_send(exc) or attempt + 1 >= max_attempts:
+                raise
+            time.sleep(get_retry_after_seconds(None, attempt))
+            continue
+        except BaseException:
+            held.close()
+            raise
+        if stream:
+            _release_when_closed(response, held)
+        else:
+            held.close()
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt + 1 >= max_attempts:
+            return response
+        # 429: 이 키는 쉬게 하고 다음 시도는 다른 키가 먼저 선택되게 합니다.
+        state.cooldown_until = time.monotonic() + get_retry_after_seconds(response, attempt)
+        response.close()
+    return response
+
+
+async def allm_request(url, *, api_keys, headers=None, json=None, timeout=None, stream=False, estimated_tokens=None,
+                       max_attempts=None):
+    """llm_request의 비동기 버전입니다(httpx). 한도·재시도·키 순환 규칙은 같습니다.
+
+    돌려받은 응답은 httpx.Response이며, stream=True이면 호출부가 aiter_lines()로 읽고 aclose()합니다.
+    """
+    api_keys = split_api_keys(api_keys)
+    if not api_keys:
+        raise ValueError('API 키가 없습니다.')
+    provider = provider_for_url(url)
+    estimated_tokens = estimate_request_tokens(json) if estimated_tokens is None else estimated_tokens
+    max_attempts = max_attempts or int(getattr(settings, 'LLM_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+
+    for attempt in range(max_attempts):
+        api_key, state = await aacquire_api_key(provider, api_keys, estimated_tokens)
+        held = AsyncExitStack()
+        try:
+            held.callback(_release_api_key, state)
+            await held.enter_async_context(allm_slot(estimated_tokens))
+            request_headers, params = _apply_api_key(provider, api_key, headers, None)
+            response = await allm_post(
+                url, headers=request_headers, params=params or None, json=json, timeout=timeout,
+                stream=stream,
+            )
+        except ASYNC_PRE_SEND_ERRORS:
+            await held.aclose()
+            if attempt + 1 >= max_attempts:
+                raise
+            await asyncio.sleep(get_retry_after_seconds(None, attempt))
+            continue
+        except BaseException:
+            await held.aclose()
+            raise
+        if stream:
+            _arelease_when_closed(response, held)
+        else:
+            await held.aclose()
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt + 1 >= max_attempts:
+            return response
+        state.cooldown_until = time.monotonic() + get_retry_after_seconds(response, attempt)
+        await response.aclose()
+    return response
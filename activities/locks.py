@@ -0,0 +1,75 @@
+"""여러 요청·작업자가 같은 비싼 작업(OCR, 요약 등)을 동시에 하지 않도록 막는 잠금 도구."""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_TIMEOUT_SECONDS = 180
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+def get_lock_timeout_seconds():
+    return int(getattr(settings, 'AI_SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS', DEFAULT_LOCK_TIMEOUT_SECONDS))
+
+
+def _get_local_lock(name):
+    with _local_locks_guard:
+        lock = _local_locks.get(name)
+        if lock is None:
+            lock = _local_locks[name] = threading.Lock()
+        return lock
+
+
+def _acquire_db_lock(name, timeout):
+    # MySQL 이름 잠금은 gunicorn 워커 프로세스 사이에서도 공유됩니다.
+    if connection.vendor != 'mysql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT GET_LOCK(%s, %s)', [name, timeout])
+        return cursor.fetchone()[0] == 1
+
+
+def _release_db_lock(name):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT RELEASE_LOCK(%s)', [name])
+
+
+@contextmanager
+def single_flight(name, timeout=None):
+    """같은 이름의 작업은 한 번에 하나만 실행하고, 나머지는 끝날 때까지 기다립니다.
+
+    기다린 쪽은 잠금을 얻은 뒤 DB에 저장된 결과를 다시 확인해 재사용해야 합니다.
+    같은 스레드에서 다시 들어오면 바로 통과하며, 제한 시간이 지나면 경고만 남기고 진행합니다.
+    """
+    timeout = get_lock_timeout_seconds() if timeout is None else timeout
+    held_names = getattr(_held, 'names', None)
+    if held_names is None:
+        held_names = _held.names = set()
+    if name in held_names:
+        yield
+        return
+
+    local_lock = _get_local_lock(name)
+    local_acquired = local_lock.acquire(timeout=timeout)
+    db_acquired = False
+    try:
+        if local_acquired:
+            db_acquired = _acquire_db_lock(name, timeout)
+        if not local_acquired or (connection.vendor == 'mysql' and not db_acquired):
+            logger.warning('잠금 대기 시간 초과, 잠금 없이 진행합니다: %s', name)
+        held_names.add(name)
+        yield
+    finally:
+        held_names.discard(name)
+        if db_acquired:
+            _release_db_lock(name)
+        if local_acquired:
+            local_lock.release()
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from activities.spend_ledger import month_start, reconcile_monthly_spend
+
+
+class Command(BaseCommand):
+    help = 'AI 사용 기록 합계로 교사별 월 누적 비용 장부를 다시 맞춥니다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            default=None,
+            help='다시 맞출 월(YYYY-MM). 생략하면 이번 달입니다.',
+        )
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month는 YYYY-MM 형식이어야 합니다.')
+        else:
+            month = month_start()
+        changed = reconcile_monthly_spend(month)
+        self.stdout.write(self.style.SUCCESS(f'{month:%Y-%m} 장부에서 교사 {changed}명의 금액을 바로잡았습니다.'))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from activities.analysis_jobs import get_job_heartbeat_seconds, get_job_stale_seconds, resume_stalled_analysis_jobs
+
+
+class Command(BaseCommand):
+    help = '서버 재시작 등으로 멈춘 AI 일괄 분석 작업을 이어서 실행합니다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-seconds',
+            type=int,
+            default=None,
+            help='이 시간(초) 이상 처리 신호가 없는 작업을 멈춘 것으로 판단합니다.',
+        )
+        parser.add_argument(
+            '--wait',
+            action='store_true',
+            help='재시작 직후처럼 이전 워커의 처리 신호가 아직 살아 있는 작업은 끊길 때까지 기다렸다가 이어받습니다.',
+        )
+
+    def handle(self, *args, **options):
+        stale_seconds = options['stale_seconds']
+        resumed = resume_stalled_analysis_jobs(stale_seconds=stale_seconds)
+        if options['wait']:
+            deadline = time.monotonic() + (
+                get_job_stale_seconds() if stale_seconds is None else stale_seconds
+            ) + get_job_heartbeat_seconds()
+            while time.monotonic() < deadline:
+                time.sleep(get_job_heartbeat_seconds())
+                resumed += resume_stalled_analysis_jobs(stale_seconds=stale_seconds)
+        if not resumed:
+            self.stdout.write('재개할 작업이 없습니다.')
+            return
+        self.stdout.write(self.style.SUCCESS(f'작업 {len(resumed)}건을 재개했습니다: {resumed}'))
+        self.stdout.write('모든 답안 처리가 끝나면 명령이 종료됩니다.')
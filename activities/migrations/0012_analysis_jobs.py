@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0011_rename_class_life_subcategory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('work_name', models.TextField(blank=True, verbose_name='분석 작업명')),
+                ('batch_id', models.CharField(blank=True, max_length=50, verbose_name='분석 세션 ID')),
+                ('options', models.JSONField(blank=True, default=dict, verbose_name='분석 옵션')),
+                ('status', models.CharField(choices=[('PENDING', '대기'), ('RUNNING', '진행 중'), ('COMPLETED', '완료'), ('FAILED', '중단')], default='PENDING', max_length=10, verbose_name='작업 상태')),
+                ('total_count', models.PositiveIntegerField(default=0, verbose_name='전체 답안 수')),
+                ('last_error', models.CharField(blank=True, max_length=500, verbose_name='중단 사유')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='마지막 처리 신호')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='요청 일시')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='시작 일시')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='종료 일시')),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_jobs', to='activities.activity', verbose_name='활동')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_jobs', to=settings.AUTH_USER_MODEL, verbose_name='요청 교사')),
+            ],
+            options={
+                'verbose_name': 'AI 일괄 분석 작업',
+                'verbose_name_plural': 'AI 일괄 분석 작업 목록',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalysisJobItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', '대기'), ('RUNNING', '처리 중'), ('SUCCESS', '완료'), ('SKIPPED', '건너뜀'), ('ERROR', '실패')], default='PENDING', max_length=10, verbose_name='처리 상태')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='시도 횟수')),
+                ('message', models.CharField(blank=True, max_length=500, verbose_name='처리 메시지')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='처리 시작')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='처리 종료')),
+                ('analysis_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='activities.analysisresult', verbose_name='분석 결과')),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_job_items', to='activities.answer', verbose_name='답안')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='activities.analysisjob', verbose_name='작업')),
+            ],
+            options={
+                'verbose_name': 'AI 일괄 분석 답안',
+                'verbose_name_plural': 'AI 일괄 분석 답안 목록',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['job', 'status'], name='analysis_job_item_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='analysisjobitem',
+            constraint=models.UniqueConstraint(fields=('job', 'answer'), name='unique_analysis_job_answer'),
+        ),
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['status', 'heartbeat_at'], name='analysis_job_status_idx'),
+        ),
+    ]
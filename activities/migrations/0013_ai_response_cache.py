@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0012_analysis_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIResponseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_hash', models.CharField(max_length=64, unique=True, verbose_name='요청 해시')),
+                ('ai_model', models.CharField(max_length=50, verbose_name='AI 모델')),
+                ('result_text', models.TextField(verbose_name='AI 응답')),
+                ('estimated_cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12, verbose_name='최초 호출 비용(USD)')),
+                ('hit_count', models.PositiveIntegerField(default=0, verbose_name='재사용 횟수')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='생성 일시')),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='마지막 사용 일시')),
+            ],
+            options={
+                'verbose_name': 'AI 응답 캐시',
+                'verbose_name_plural': 'AI 응답 캐시 목록',
+            },
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='is_cache_hit',
+            field=models.BooleanField(default=False, verbose_name='캐시 재사용'),
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='saved_cost_usd',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=12, verbose_name='절감 비용(USD)'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0013_ai_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityfile',
+            name='source_modified_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='해시 기준 수정 시각'),
+        ),
+        migrations.AddField(
+            model_name='activityfile',
+            name='source_name',
+            field=models.CharField(blank=True, max_length=255, verbose_name='해시 기준 파일 경로'),
+        ),
+        migrations.AddField(
+            model_name='activityfile',
+            name='source_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='해시 기준 파일 크기'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0014_activityfile_source_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityfile',
+            name='ocr_cost_usd',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=12, verbose_name='OCR 비용(USD)'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0015_activityfile_ocr_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentPageOCR',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_hash', models.CharField(max_length=64, verbose_name='페이지 해시')),
+                ('ai_model', models.CharField(max_length=50, verbose_name='OCR 모델')),
+                ('extracted_text', models.TextField(blank=True, verbose_name='OCR 텍스트')),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12, verbose_name='OCR 비용(USD)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='생성 일시')),
+            ],
+            options={
+                'verbose_name': '첨부 PDF 페이지 OCR',
+                'verbose_name_plural': '첨부 PDF 페이지 OCR 목록',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='attachmentpageocr',
+            constraint=models.UniqueConstraint(fields=('page_hash', 'ai_model'), name='unique_attachment_page_ocr'),
+        ),
+    ]
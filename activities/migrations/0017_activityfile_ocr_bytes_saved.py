@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0016_attachment_page_ocr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityfile',
+            name='ocr_bytes_saved',
+            field=models.BigIntegerField(default=0, verbose_name='OCR 전처리 절감 바이트'),
+        ),
+    ]
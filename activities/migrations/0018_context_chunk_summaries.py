@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0017_activityfile_ocr_bytes_saved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityanalysiscontext',
+            name='chunk_summaries',
+            field=models.JSONField(blank=True, default=dict, verbose_name='조각별 요약 캐시'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def attach_existing_contexts_to_first_question(apps, schema_editor):
+    # 기존 캐시는 문항 없이 호출될 때처럼 활동의 첫 문항 기준으로 만들어졌습니다.
+    ActivityAnalysisContext = apps.get_model('activities', 'ActivityAnalysisContext')
+    Question = apps.get_model('activities', 'Question')
+    for context in ActivityAnalysisContext.objects.filter(question__isnull=True):
+        first_question_id = (
+            Question.objects.filter(activity_id=context.activity_id)
+            .order_by('id').values_list('id', flat=True).first()
+        )
+        if first_question_id:
+            ActivityAnalysisContext.objects.filter(pk=context.pk).update(question_id=first_question_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0018_context_chunk_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityanalysiscontext',
+            name='question',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analysis_contexts', to='activities.question', verbose_name='문항'),
+        ),
+        migrations.AlterField(
+            model_name='activityanalysiscontext',
+            name='activity',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_contexts', to='activities.activity', verbose_name='활동'),
+        ),
+        migrations.RunPython(attach_existing_contexts_to_first_question, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='activityanalysiscontext',
+            constraint=models.UniqueConstraint(fields=('activity', 'question'), name='unique_activity_question_context'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill_current_month(apps, schema_editor):
+    # 배포 직후에도 이번 달 예산 확인이 맞도록 이번 달 사용 기록만 장부에 옮깁니다.
+    AIUsageLog = apps.get_model('activities', 'AIUsageLog')
+    AIMonthlySpend = apps.get_model('activities', 'AIMonthlySpend')
+    local_now = timezone.localtime()
+    month_start = local_now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    totals = (
+        AIUsageLog.objects.filter(created_at__gte=month_start)
+        .values('teacher_id')
+        .annotate(total=Sum('estimated_cost_usd'))
+    )
+    AIMonthlySpend.objects.bulk_create([
+        AIMonthlySpend(teacher_id=row['teacher_id'], month=month_start.date(), spent_usd=row['total'])
+        for row in totals
+        if row['total']
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0019_analysis_context_per_question'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIMonthlySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='월(1일)')),
+                ('spent_usd', models.DecimalField(decimal_places=6, default=0, max_digits=14, verbose_name='누적 비용(USD)')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='수정 일시')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_monthly_spends', to=settings.AUTH_USER_MODEL, verbose_name='교사')),
+            ],
+            options={
+                'verbose_name': 'AI 월별 사용 금액',
+                'verbose_name_plural': 'AI 월별 사용 금액 목록',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='aimonthlyspend',
+            constraint=models.UniqueConstraint(fields=('teacher', 'month'), name='unique_teacher_monthly_spend'),
+        ),
+        migrations.RunPython(backfill_current_month, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0020_ai_monthly_spend_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='batch_id',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='분석 세션 ID'),
+        ),
+        migrations.AddIndex(
+            model_name='aiusagelog',
+            index=models.Index(fields=['activity', 'batch_id'], name='ai_usage_batch_idx'),
+        ),
+    ]
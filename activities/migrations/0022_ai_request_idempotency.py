@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0021_usage_log_batch_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIRequestIdempotency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, verbose_name='요청 키')),
+                ('status', models.CharField(choices=[('IN_PROGRESS', '진행 중'), ('COMPLETED', '완료'), ('FAILED', '실패')], default='IN_PROGRESS', max_length=20, verbose_name='상태')),
+                ('response_body', models.JSONField(blank=True, null=True, verbose_name='응답 본문')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='생성 일시')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='수정 일시')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_request_keys', to=settings.AUTH_USER_MODEL, verbose_name='교사')),
+            ],
+            options={
+                'verbose_name': 'AI 요청 중복 방지 키',
+                'verbose_name_plural': 'AI 요청 중복 방지 키 목록',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='airequestidempotency',
+            constraint=models.UniqueConstraint(fields=('teacher', 'key'), name='unique_teacher_idempotency_key'),
+        ),
+    ]
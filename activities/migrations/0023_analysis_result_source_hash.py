@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0022_ai_request_idempotency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisresult',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='분석 당시 답안 해시'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0023_analysis_result_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='representative_map',
+            field=models.JSONField(blank=True, default=dict, verbose_name='대표 답안 대응표'),
+        ),
+    ]
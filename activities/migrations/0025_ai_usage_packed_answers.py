@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0024_analysis_job_representative_map'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='packed_answers',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='묶음 답안 수'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0025_ai_usage_packed_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityfile',
+            name='extraction_stop_reason',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='추출 중단 사유'),
+        ),
+    ]
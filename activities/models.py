@@ -280,6 +280,8 @@ class AnalysisResult(models.Model):
     ai_model = models.CharField(max_length=50, default='gemini-2.0-flash', verbose_name="AI 모델")
     work_name = models.TextField(null=True, blank=True, verbose_name="분석 작업명")
     batch_id = models.CharField(max_length=50, null=True, blank=True, verbose_name="분석 세션 ID")
+    # 분석 당시 답안 본문(display_content)의 sha256. 변경된 답안만 다시 분석할 때 비교합니다.
+    source_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="분석 당시 답안 해시")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="분석 생성일")
     
     class Meta:
@@ -412,6 +414,10 @@ class ActivityFile(models.Model):
     file = models.FileField(upload_to='activity_files/%Y/%m/%d/', verbose_name="첨부파일")
     created_at = models.DateTimeField(auto_now_add=True)
     content_hash = models.CharField(max_length=64, blank=True, db_index=True, verbose_name='파일 해시')
+    # 파일을 다시 읽지 않고 변경 여부를 확인하기 위한 저장소 메타데이터
+    source_name = models.CharField(max_length=255, blank=True, verbose_name='해시 기준 파일 경로')
+    source_size = models.BigIntegerField(null=True, blank=True, verbose_name='해시 기준 파일 크기')
+    source_modified_at = models.DateTimeField(null=True, blank=True, verbose_name='해시 기준 수정 시각')
     extraction_status = models.CharField(
         max_length=16,
         choices=ExtractionStatus.choices,
@@ -420,8 +426,13 @@ class ActivityFile(models.Model):
     )
     extracted_text = models.TextField(blank=True, verbose_name='추출 텍스트')
     extracted_char_count = models.PositiveIntegerField(default=0, verbose_name='추출 글자 수')
+    # 쪽수·시간·글자 수 한도로 원문 일부만 저장했을 때의 사유(다 읽었으면 빈 값)
+    extraction_stop_reason = models.CharField(max_length=100, blank=True, default='', verbose_name='추출 중단 사유')
     extracted_at = models.DateTimeField(null=True, blank=True, verbose_name='추출 일시')
     extraction_error = models.CharField(max_length=500, blank=True, verbose_name='추출 오류')
+    # 같은 해시의 파일을 다른 활동에서 재사용할 때 절감 비용으로 기록할 OCR 비용
+    ocr_cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0, verbose_name='OCR 비용(USD)')
+    ocr_bytes_saved = models.BigIntegerField(default=0, verbose_name='OCR 전처리 절감 바이트')
 
     # 파일명만 추출하는 프로퍼티 (기존 Activity에 있던 로직을 여기로 이동)
     @property
@@ -435,26 +446,61 @@ class ActivityFile(models.Model):
         verbose_name_plural = "평가/활동 첨부파일 목록"
 
 
+class AttachmentPageOCR(models.Model):
+    """스캔 PDF 한 쪽의 OCR 결과를 페이지 내용 해시로 보관해 재업로드 시 재사용합니다."""
+
+    page_hash = models.CharField(max_length=64, verbose_name='페이지 해시')
+    ai_model = models.CharField(max_length=50, verbose_name='OCR 모델')
+    extracted_text = models.TextField(blank=True, verbose_name='OCR 텍스트')
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0, verbose_name='OCR 비용(USD)')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성 일시')
+
+    class Meta:
+        verbose_name = '첨부 PDF 페이지 OCR'
+        verbose_name_plural = '첨부 PDF 페이지 OCR 목록'
+        constraints = [
+            models.UniqueConstraint(fields=['page_hash', 'ai_model'], name='unique_attachment_page_ocr'),
+        ]
+
+    def __str__(self):
+        return f'{self.ai_model} · {self.page_hash[:12]}'
+
+
 class ActivityAnalysisContext(models.Model):
-    """활동 공통 자료를 학생별 분석에서 재사용하기 위한 캐시입니다."""
+    """활동 공통 자료를 학생별 분석에서 재사용하기 위한 캐시입니다.
+
+    문항마다 내용·참고 자료·조건이 달라 컨텍스트도 달라지므로 (활동, 문항) 단위로 보관합니다.
+    """
 
-    activity = models.OneToOneField(
+    activity = models.ForeignKey(
         Activity,
         on_delete=models.CASCADE,
-        related_name='analysis_context_cache',
+        related_name='analysis_contexts',
         verbose_name='활동',
     )
+    question = models.ForeignKey(
+        'Question',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='analysis_contexts',
+        verbose_name='문항',
+    )
     source_fingerprint = models.CharField(max_length=64, db_index=True, verbose_name='원본 지문')
     structured_context = models.TextField(blank=True, verbose_name='구조화된 활동 컨텍스트')
     summary_text = models.TextField(blank=True, verbose_name='AI 분석용 요약본')
     summary_model = models.CharField(max_length=50, blank=True, verbose_name='요약 모델')
     summary_usage = models.JSONField(default=dict, blank=True, verbose_name='요약 토큰 사용량')
+    chunk_summaries = models.JSONField(default=dict, blank=True, verbose_name='조각별 요약 캐시')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성 일시')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='갱신 일시')
 
     class Meta:
         verbose_name = '활동 AI 컨텍스트 캐시'
         verbose_name_plural = '활동 AI 컨텍스트 캐시 목록'
+        constraints = [
+            models.UniqueConstraint(fields=['activity', 'question'], name='unique_activity_question_context'),
+        ]
 
     def __str__(self):
         return f'{self.activity.title} 분석 컨텍스트'
@@ -480,18 +526,180 @@ class AIUsageLog(models.Model):
     )
     operation = models.CharField(max_length=24, choices=Operation.choices, verbose_name='작업')
     ai_model = models.CharField(max_length=50, verbose_name='AI 모델')
+    batch_id = models.CharField(max_length=50, blank=True, default='', verbose_name='분석 세션 ID')
     prompt_tokens = models.PositiveIntegerField(default=0, verbose_name='입력 토큰')
     cached_tokens = models.PositiveIntegerField(default=0, verbose_name='캐시 입력 토큰')
     completion_tokens = models.PositiveIntegerField(default=0, verbose_name='출력 토큰')
     total_tokens = models.PositiveIntegerField(default=0, verbose_name='전체 토큰')
     estimated_cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0, verbose_name='예상 비용(USD)')
+    is_cache_hit = models.BooleanField(default=False, verbose_name='캐시 재사용')
+    saved_cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0, verbose_name='절감 비용(USD)')
+    # 답안 여러 개를 한 호출로 묶어 분석한 기록이면 그 답안 수(답안당 토큰 = 토큰 ÷ 묶음 답안 수)
+    packed_answers = models.PositiveSmallIntegerField(default=1, verbose_name='묶음 답안 수')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='사용 일시')
 
     class Meta:
         verbose_name = 'AI 토큰 사용 기록'
         verbose_name_plural = 'AI 토큰 사용 기록 목록'
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['teacher', 'created_at'], name='ai_usage_teacher_idx')]
+        indexes = [
+            models.Index(fields=['teacher', 'created_at'], name='ai_usage_teacher_idx'),
+            models.Index(fields=['activity', 'batch_id'], name='ai_usage_batch_idx'),
+        ]
 
     def __str__(self):
         return f'{self.teacher} · {self.operation} · {self.total_tokens}'
+
+
+class AIMonthlySpend(models.Model):
+    """교사별 월 누적 AI 비용입니다. 사용 기록을 남길 때 함께 더해 예산 확인을 한 행 조회로 끝냅니다."""
+
+    teacher = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_monthly_spends', verbose_name='교사'
+    )
+    month = models.DateField(verbose_name='월(1일)')
+    spent_usd = models.DecimalField(max_digits=14, decimal_places=6, default=0, verbose_name='누적 비용(USD)')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='수정 일시')
+
+    class Meta:
+        verbose_name = 'AI 월별 사용 금액'
+        verbose_name_plural = 'AI 월별 사용 금액 목록'
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(fields=['teacher', 'month'], name='unique_teacher_monthly_spend')
+        ]
+
+    def __str__(self):
+        return f'{self.teacher} · {self.month:%Y-%m} · {self.spent_usd}'
+
+
+class AIResponseCache(models.Model):
+    """모델·온도·프롬프트가 같은 분석 요청의 AI 응답을 재사용하기 위한 캐시입니다."""
+
+    request_hash = models.CharField(max_length=64, unique=True, verbose_name='요청 해시')
+    ai_model = models.CharField(max_length=50, verbose_name='AI 모델')
+    result_text = models.TextField(verbose_name='AI 응답')
+    estimated_cost_usd = models.DecimalField(
+        max_digits=12, decimal_places=6, default=0, verbose_name='최초 호출 비용(USD)'
+    )
+    hit_count = models.PositiveIntegerField(default=0, verbose_name='재사용 횟수')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='생성 일시')
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='마지막 사용 일시')
+
+    class Meta:
+        verbose_name = 'AI 응답 캐시'
+        verbose_name_plural = 'AI 응답 캐시 목록'
+
+    def __str__(self):
+        return f'{self.ai_model} · {self.request_hash[:12]}'
+
+
+class AIRequestIdempotency(models.Model):
+    """브라우저가 같은 분석 요청을 다시 보낼 때 두 번 호출·과금하지 않도록 요청 키별 진행 상태와 응답을 잠시 보관합니다."""
+
+    class Status(models.TextChoices):
+        IN_PROGRESS = 'IN_PROGRESS', '진행 중'
+        COMPLETED = 'COMPLETED', '완료'
+        FAILED = 'FAILED', '실패'
+
+    teacher = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_request_keys', verbose_name='교사'
+    )
+    # 브라우저가 답안·분석 묶음(batch_id)·클릭마다 만들어 재시도 때 그대로 보내는 키
+    key = models.CharField(max_length=100, verbose_name='요청 키')
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.IN_PROGRESS, verbose_name='상태'
+    )
+    response_body = models.JSONField(null=True, blank=True, verbose_name='응답 본문')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='생성 일시')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='수정 일시')
+
+    class Meta:
+        verbose_name = 'AI 요청 중복 방지 키'
+        verbose_name_plural = 'AI 요청 중복 방지 키 목록'
+        constraints = [
+            models.UniqueConstraint(fields=['teacher', 'key'], name='unique_teacher_idempotency_key')
+        ]
+
+    def __str__(self):
+        return f'{self.teacher} · {self.key} · {self.get_status_display()}'
+
+
+class AnalysisJob(models.Model):
+    """교사가 한 번 요청한 일괄 AI 분석을 서버 작업 풀에서 이어서 처리하기 위한 작업 단위입니다."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', '대기'
+        RUNNING = 'RUNNING', '진행 중'
+        COMPLETED = 'COMPLETED', '완료'
+        FAILED = 'FAILED', '중단'
+
+    activity = models.ForeignKey(
+        Activity, on_delete=models.CASCADE, related_name='analysis_jobs', verbose_name='활동'
+    )
+    teacher = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='analysis_jobs', verbose_name='요청 교사'
+    )
+    work_name = models.TextField(blank=True, verbose_name='분석 작업명')
+    batch_id = models.CharField(max_length=50, blank=True, verbose_name='분석 세션 ID')
+    options = models.JSONField(default=dict, blank=True, verbose_name='분석 옵션')
+    # 대표 답안만 분석한 작업의 {건너뛴 답안 id(문자열): 대표 답안 id}. 결과 화면은 다시 묶지 않고 이 기록을 씁니다.
+    representative_map = models.JSONField(default=dict, blank=True, verbose_name='대표 답안 대응표')
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name='작업 상태'
+    )
+    total_count = models.PositiveIntegerField(default=0, verbose_name='전체 답안 수')
+    last_error = models.CharField(max_length=500, blank=True, verbose_name='중단 사유')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='마지막 처리 신호')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='요청 일시')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='시작 일시')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='종료 일시')
+
+    class Meta:
+        verbose_name = 'AI 일괄 분석 작업'
+        verbose_name_plural = 'AI 일괄 분석 작업 목록'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'heartbeat_at'], name='analysis_job_status_idx')]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.COMPLETED, self.Status.FAILED)
+
+    def __str__(self):
+        return f'{self.work_name or "제목 없는 분석"} ({self.get_status_display()})'
+
+
+class AnalysisJobItem(models.Model):
+    """일괄 분석 작업에 포함된 답안별 처리 상태입니다."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', '대기'
+        RUNNING = 'RUNNING', '처리 중'
+        SUCCESS = 'SUCCESS', '완료'
+        SKIPPED = 'SKIPPED', '건너뜀'
+        ERROR = 'ERROR', '실패'
+
+    job = models.ForeignKey(AnalysisJob, on_delete=models.CASCADE, related_name='items', verbose_name='작업')
+    answer = models.ForeignKey('Answer', on_delete=models.CASCADE, related_name='analysis_job_items', verbose_name='답안')
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name='처리 상태'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='시도 횟수')
+    message = models.CharField(max_length=500, blank=True, verbose_name='처리 메시지')
+    analysis_result = models.ForeignKey(
+        AnalysisResult, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='분석 결과'
+    )
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='처리 시작')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='처리 종료')
+
+    class Meta:
+        verbose_name = 'AI 일괄 분석 답안'
+        verbose_name_plural = 'AI 일괄 분석 답안 목록'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'answer'], name='unique_analysis_job_answer')
+        ]
+        indexes = [models.Index(fields=['job', 'status'], name='analysis_job_item_idx')]
+
+    def __str__(self):
+        return f'{self.job_id} · {self.answer_id} · {self.status}'
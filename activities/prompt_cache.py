@@ -0,0 +1,45 @@
+"""같은 설정으로 조립한 분석용 시스템 프롬프트를 프로세스 안에서 재사용하는 메모."""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+DEFAULT_PROMPT_CACHE_TTL_SECONDS = 600
+MAX_CACHED_PROMPTS = 256
+
+_compiled_prompts = OrderedDict()
+_compiled_prompts_lock = threading.Lock()
+
+
+def get_prompt_cache_ttl_seconds():
+    return int(getattr(settings, 'AI_PROMPT_CACHE_TTL_SECONDS', DEFAULT_PROMPT_CACHE_TTL_SECONDS))
+
+
+def get_or_compile_prompt(key, compile_prompt):
+    """key로 메모된 프롬프트가 TTL 안이면 돌려주고, 아니면 compile_prompt()로 새로 만듭니다.
+
+    조립 중 오류(권한 없는 페르소나 등)는 메모하지 않고 그대로 올립니다.
+    """
+    ttl_seconds = get_prompt_cache_ttl_seconds()
+    if ttl_seconds <= 0:
+        return compile_prompt()
+    now = time.monotonic()
+    with _compiled_prompts_lock:
+        entry = _compiled_prompts.get(key)
+        if entry is not None and entry[0] > now:
+            _compiled_prompts.move_to_end(key)
+            return entry[1]
+    compiled = compile_prompt()
+    with _compiled_prompts_lock:
+        _compiled_prompts[key] = (now + ttl_seconds, compiled)
+        _compiled_prompts.move_to_end(key)
+        while len(_compiled_prompts) > MAX_CACHED_PROMPTS:
+            _compiled_prompts.popitem(last=False)
+    return compiled
+
+
+def clear_compiled_prompts():
+    with _compiled_prompts_lock:
+        _compiled_prompts.clear()
@@ -0,0 +1,107 @@
+"""같은 조건의 학생 답안 분석을 다시 요청할 때 이전 AI 응답을 재사용하는 캐시 계층."""
+
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AIResponseCache, AIUsageLog
+
+DEFAULT_CACHE_TTL_SECONDS = 14 * 24 * 60 * 60
+DEFAULT_CACHE_MAX_ENTRIES = 20_000
+
+
+def get_cache_ttl_seconds():
+    return int(getattr(settings, 'AI_RESPONSE_CACHE_TTL_SECONDS', DEFAULT_CACHE_TTL_SECONDS))
+
+
+def get_cache_max_entries():
+    return int(getattr(settings, 'AI_RESPONSE_CACHE_MAX_ENTRIES', DEFAULT_CACHE_MAX_ENTRIES))
+
+
+def build_analysis_cache_key(plan):
+    """모델에 실제로 전달되는 값(모델·온도·시스템 프롬프트·최종 프롬프트)만으로 키를 만듭니다."""
+    source = json.dumps(
+        [
+            plan['ai_model'],
+            round(float(plan['temperature']), 3),
+            plan['effective_system_prompt'],
+            plan['final_prompt'],
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def get_cached_analysis(request_hash):
+    if get_cache_ttl_seconds() <= 0:
+        return None
+    cutoff = timezone.now() - timedelta(seconds=get_cache_ttl_seconds())
+    entry = AIResponseCache.objects.filter(request_hash=request_hash, created_at__gte=cutoff).first()
+    if entry is None:
+        return None
+    AIResponseCache.objects.filter(pk=entry.pk).update(
+        hit_count=F('hit_count') + 1, last_used_at=timezone.now()
+    )
+    return entry
+
+
+def store_cached_analysis(request_hash, plan, result_text, analysis_usage):
+    if get_cache_ttl_seconds() <= 0 or not result_text:
+        return
+    defaults = {
+        'ai_model': plan['ai_model'],
+        'result_text': result_text,
+        'estimated_cost_usd': Decimal(str((analysis_usage or {}).get('estimated_cost_usd') or '0')),
+        'last_used_at': timezone.now(),
+    }
+    try:
+        # 만료된 항목을 다시 채울 때는 created_at도 새로 잡아 TTL을 초기화합니다.
+        AIResponseCache.objects.filter(request_hash=request_hash).delete()
+        AIResponseCache.objects.create(request_hash=request_hash, **defaults)
+    except IntegrityError:
+        # 같은 요청이 동시에 끝난 경우 먼저 저장된 응답을 그대로 둡니다.
+        return
+    prune_analysis_cache()
+
+
+def prune_analysis_cache():
+    """만료 항목을 지우고, 최대 개수를 넘으면 가장 오래 쓰이지 않은 항목부터 지웁니다."""
+    cutoff = timezone.now() - timedelta(seconds=get_cache_ttl_seconds())
+    AIResponseCache.objects.filter(created_at__lt=cutoff).delete()
+    max_entries = get_cache_max_entries()
+    overflow = AIResponseCache.objects.count() - max_entries
+    if overflow > 0:
+        stale_ids = list(
+            AIResponseCache.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow]
+        )
+        AIResponseCache.objects.filter(id__in=stale_ids).delete()
+
+
+def record_cache_hit_usage(plan, entry):
+    """캐시 재사용을 비용 0원 사용 기록으로 남기고, 아낀 비용을 함께 기록합니다."""
+    AIUsageLog.objects.create(
+        teacher=plan['teacher'],
+        activity=plan['activity'],
+        answer=plan['answer'],
+        operation=AIUsageLog.Operation.STUDENT_ANALYSIS,
+        ai_model=entry.ai_model,
+        batch_id=plan.get('batch_id') or '',
+        estimated_cost_usd=Decimal('0'),
+        is_cache_hit=True,
+        saved_cost_usd=entry.estimated_cost_usd,
+    )
+    return {
+        'prompt_tokens': 0,
+        'cached_tokens': 0,
+        'completion_tokens': 0,
+        'total_tokens': 0,
+        'estimated_cost_usd': '0',
+        'cache_hit': True,
+        'saved_cost_usd': str(entry.estimated_cost_usd),
+    }
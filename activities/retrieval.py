@@ -0,0 +1,123 @@
+"""첨부자료 본문을 문단 조각으로 나눠 문항과 관련된 부분만 골라내는 로컬 검색 색인(BM25)."""
+
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+CHUNK_TARGET_CHARS = 700
+CHUNK_OVERLAP_CHARS = 120
+BM25_K1 = 1.5
+BM25_B = 0.75
+MAX_CACHED_INDEXES = 64
+
+_WORD_PATTERN = re.compile(r'[0-9A-Za-z가-힣]+')
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def tokenize(text):
+    """한국어는 띄어쓰기·조사 때문에 단어 일치가 약하므로 단어와 글자 2-gram을 함께 씁니다."""
+    tokens = []
+    for word in _WORD_PATTERN.findall((text or '').lower()):
+        tokens.append(word)
+        if len(word) > 2:
+            tokens.extend(word[index:index + 2] for index in range(len(word) - 1))
+    return tokens
+
+
+def chunk_text(text, target_chars=CHUNK_TARGET_CHARS, overlap_chars=CHUNK_OVERLAP_CHARS):
+    """문단 경계를 살려 target_chars 안팎의 조각으로 나눕니다. 긴 문단은 겹치게 자릅니다."""
+    chunks = []
+    current = ''
+    for paragraph in re.split(r'\n\s*\n|\n', text or ''):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > target_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(paragraph[:target_chars])
+            paragraph = paragraph[target_chars - overlap_chars:]
+        if current and len(current) + len(paragraph) + 1 > target_chars:
+            chunks.append(current)
+            current = ''
+        current = f'{current}\n{paragraph}' if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, passages):
+        # passages: [(출처 이름, 본문)]
+        self.passages = list(passages)
+        self.term_counts = [Counter(tokenize(text)) for _, text in self.passages]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        passage_count = len(self.passages)
+        self.idf = {
+            term: math.log(1 + (passage_count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def score(self, query_terms, passage_index):
+        counts = self.term_counts[passage_index]
+        length_norm = 1 - BM25_B + BM25_B * (self.lengths[passage_index] / (self.average_length or 1))
+        total = 0.0
+        for term, query_weight in query_terms.items():
+            frequency = counts.get(term)
+            if not frequency:
+                continue
+            total += query_weight * self.idf[term] * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+        return total
+
+    def search(self, query, top_k=8, max_chars=None):
+        """점수 순으로 고른 뒤 원문 순서로 돌려줍니다. max_chars를 넘기면 더 담지 않습니다."""
+        query_terms = Counter(tokenize(query))
+        if not query_terms or not self.passages:
+            return []
+        scored = sorted(
+            ((self.score(query_terms, index), index) for index in range(len(self.passages))),
+            reverse=True,
+        )
+        selected = []
+        used_chars = 0
+        for score, index in scored:
+            if score <= 0 or len(selected) >= top_k:
+                break
+            passage_chars = len(self.passages[index][1])
+            if max_chars and selected and used_chars + passage_chars > max_chars:
+                continue
+            selected.append(index)
+            used_chars += passage_chars
+        return [self.passages[index] for index in sorted(selected)]
+
+
+def build_passages(documents):
+    """[(출처 이름, 전체 본문)] → [(출처 이름, 조각)]"""
+    return [
+        (source_name, chunk)
+        for source_name, text in documents
+        for chunk in chunk_text(text)
+    ]
+
+
+def get_or_build_index(cache_key, documents_loader):
+    """같은 첨부 구성(cache_key)이면 프로세스 안에 만들어 둔 색인을 재사용합니다."""
+    with _index_cache_lock:
+        index = _index_cache.get(cache_key)
+        if index is not None:
+            _index_cache.move_to_end(cache_key)
+            return index
+    index = BM25Index(build_passages(documents_loader()))
+    with _index_cache_lock:
+        _index_cache[cache_key] = index
+        while len(_index_cache) > MAX_CACHED_INDEXES:
+            _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import Persona, ToneStylePreset
+from .prompt_cache import clear_compiled_prompts
+
+
+@receiver([post_save, post_delete], sender=Persona)
+@receiver([post_save, post_delete], sender=ToneStylePreset)
+def clear_compiled_prompts_on_change(sender, **kwargs):
+    # 페르소나 문구나 문체 프리셋이 바뀌면 메모된 시스템 프롬프트를 모두 다시 조립합니다.
+    clear_compiled_prompts()
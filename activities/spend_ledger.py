@@ -0,0 +1,83 @@
+"""교사별 월 AI 비용 누적 장부. 예산 확인이 사용 기록 전체를 합산하지 않도록 합니다."""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import AIMonthlySpend, AIUsageLog
+
+
+def month_start(moment=None):
+    """예산 확인과 같은 기준(서버 현지 시각)으로 그 달 1일을 돌려줍니다."""
+    local_now = timezone.localtime(moment) if moment is not None else timezone.localtime()
+    return local_now.date().replace(day=1)
+
+
+def add_monthly_spend(teacher, amount, moment=None):
+    """비용을 이번 달 장부에 원자적으로 더합니다(F 표현식으로 동시 갱신에도 누락 없음)."""
+    amount = Decimal(str(amount or '0'))
+    if amount <= 0 or teacher is None:
+        return
+    month = month_start(moment)
+    updated = AIMonthlySpend.objects.filter(teacher=teacher, month=month).update(
+        spent_usd=F('spent_usd') + amount, updated_at=timezone.now()
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            AIMonthlySpend.objects.create(teacher=teacher, month=month, spent_usd=amount)
+    except IntegrityError:
+        # 다른 요청이 같은 달 행을 먼저 만든 경우 그 행에 더합니다.
+        AIMonthlySpend.objects.filter(teacher=teacher, month=month).update(
+            spent_usd=F('spent_usd') + amount, updated_at=timezone.now()
+        )
+
+
+def get_monthly_spend(teacher, moment=None):
+    spent = (
+        AIMonthlySpend.objects.filter(teacher=teacher, month=month_start(moment))
+        .values_list('spent_usd', flat=True)
+        .first()
+    )
+    return spent if spent is not None else Decimal('0')
+
+
+def _month_range(month):
+    next_month = date(month.year + (month.month // 12), month.month % 12 + 1, 1)
+    current_tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime(month.year, month.month, 1), current_tz),
+        timezone.make_aware(datetime(next_month.year, next_month.month, 1), current_tz),
+    )
+
+
+def reconcile_monthly_spend(month=None):
+    """해당 월 AIUsageLog 합계로 장부를 다시 맞춥니다. 달라진 교사 수를 돌려줍니다."""
+    month = (month or month_start()).replace(day=1)
+    start, end = _month_range(month)
+    totals = {
+        row['teacher']: row['total'] or Decimal('0')
+        for row in AIUsageLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        .values('teacher')
+        .annotate(total=Sum('estimated_cost_usd'))
+    }
+    ledger = {
+        row.teacher_id: row
+        for row in AIMonthlySpend.objects.filter(month=month)
+    }
+    changed = 0
+    for teacher_id in set(totals) | set(ledger):
+        total = totals.get(teacher_id, Decimal('0'))
+        row = ledger.get(teacher_id)
+        if row is None:
+            if total > 0:
+                AIMonthlySpend.objects.create(teacher_id=teacher_id, month=month, spent_usd=total)
+                changed += 1
+        elif row.spent_usd != total:
+            AIMonthlySpend.objects.filter(pk=row.pk).update(spent_usd=total, updated_at=timezone.now())
+            changed += 1
+    return changed
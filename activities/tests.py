@@ -1,27 +1,92 @@
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
 from types import SimpleNamespace
+import asyncio
+import io
+import json
+from unittest.mock import AsyncMock, patch
 from pathlib import Path
 import re
 
+import requests
+from asgiref.sync import async_to_sync
 from django.test import RequestFactory, SimpleTestCase, override_settings
 from django.template.loader import get_template
 from django.template import Context, Template
 from django.urls import reverse
 from django.conf import settings
+from urllib3.exceptions import NewConnectionError
 
 from .views.exam_views import pdf_viewer
 from .views.main_views import get_form_config
 from .views.ai_views import (
+    AnalysisRequestError,
     FEEDBACK_BASE_PROMPT,
+    api_process_db_row,
+    astream_student_analysis_completion,
+    build_openai_analysis_messages,
+    claim_or_attach_idempotent_request,
+    build_packed_analysis_prompt,
     compose_ai_system_prompt,
+    compose_style_prompt,
+    execute_packed_student_analyses,
+    get_monthly_ai_budget_status,
+    get_prompt_cache_key,
+    get_compiled_system_prompt,
     get_school_level_prompt,
     normalize_tone_attribute_value,
+    parse_packed_analysis_results,
+    request_packed_analysis_completion,
+    stream_student_analysis_completion,
     TASK_OUTPUT_CONTRACTS,
     TASK_USER_INSTRUCTIONS,
 )
+from .analysis_jobs import clean_analysis_job_options, create_analysis_job, job_heartbeat
+from .response_cache import build_analysis_cache_key
+from .answer_clusters import (
+    cluster_answers,
+    describe_answer_clusters,
+    find_near_duplicate_groups,
+    get_saved_representative_maps,
+)
+from .delta_analysis import answer_content_hash, is_answer_changed, split_changed_answers
+from .idempotency import get_request_idempotency_key
+from .locks import single_flight
+from .llm_scheduler import BATCH, INTERACTIVE, FairShareScheduler, _slot_held, llm_caller, llm_slot
+from .prompt_cache import clear_compiled_prompts
+from .signals import clear_compiled_prompts_on_change
+from .spend_ledger import month_start
+from .token_estimator import count_tokens, estimate_analysis_batch, estimate_exceeds_budget
+from .retrieval import BM25Index, build_passages, chunk_text
+from .llm_transport import (
+    TokenBucket,
+    _async_clients,
+    _get_key_state,
+    allm_request,
+    close_llm_sessions,
+    get_async_llm_client,
+    get_llm_session,
+    get_llm_timeout,
+    get_retry_after_seconds,
+    llm_request,
+    provider_for_url,
+)
 from .attachment_context import (
+    CONTEXT_MODE_DIRECT,
+    CONTEXT_MODE_RETRIEVAL,
+    CONTEXT_MODE_SUMMARY,
+    MAX_ATTACHMENT_CONTEXT_CHARS,
+    _get_analysis_ready_context,
+    cap_verbatim_context,
+    ensure_activity_file_extracted,
     estimate_openai_cost_usd,
     extract_text_from_upload,
+    get_prompt_cache_stats,
     normalize_openai_usage,
+    record_openai_usage,
+    schedule_activity_context_warmup,
+    summarize_activity_context,
+    warm_activity_context,
 )
 from .templatetags.answer_extras import non_whitespace_length
 
@@ -445,8 +510,106 @@ class PdfViewerTests(SimpleTestCase):
 
 class AttachmentContextUnitTests(SimpleTestCase):
     def test_utf8_text_attachment_is_extracted_without_api_call(self):
-        extracted = extract_text_from_upload('reference.txt', '평가 참고 자료'.encode('utf-8'))
+        extracted, stop_reason = extract_text_from_upload('reference.txt', '평가 참고 자료'.encode('utf-8'))
         self.assertEqual('평가 참고 자료', extracted)
+        self.assertEqual('', stop_reason)
+
+    @patch('activities.attachment_context.MAX_EXTRACTED_CHARS_PER_FILE', 40)
+    def test_spreadsheet_extraction_stops_at_character_budget(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        for row_no in range(1, 1001):
+            sheet.append([f'학생{row_no}', '응답'])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        extracted, stop_reason = extract_text_from_upload('scores.xlsx', buffer.getvalue())
+        self.assertIn('학생1 | 응답', extracted)
+        self.assertNotIn('학생999', extracted)
+        self.assertEqual('글자 수 한도(40자)', stop_reason)
+
+    def test_scanned_pdf_ocr_runs_per_page_and_reuses_cached_pages(self):
+        import hashlib
+        from unittest.mock import MagicMock
+        from pypdf import PdfWriter
+        from .attachment_context import extract_text_with_openai_ocr, split_pdf_pages
+
+        writer = PdfWriter()
+        for width in (200, 300, 400):
+            writer.add_blank_page(width, 200)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        pages, total_pages = split_pdf_pages(buffer.getvalue())
+        self.assertEqual(3, total_pages)
+        cached_hash = hashlib.sha256(pages[1]).hexdigest()
+
+        page_store = MagicMock()
+        page_store.filter.return_value.values_list.return_value = [(cached_hash, '둘째 쪽(캐시)')]
+        ocr_calls = []
+
+        def fake_ocr(content, *, api_key, model):
+            ocr_calls.append(content)
+            return f'쪽 {len(ocr_calls)}', {'usage': {'input_tokens': 100, 'output_tokens': 10}}
+
+        with patch('activities.attachment_context.AttachmentPageOCR.objects', page_store), \
+                patch('activities.attachment_context._request_openai_ocr', side_effect=fake_ocr):
+            text, response_data = extract_text_with_openai_ocr(
+                filename='scan.pdf', data=buffer.getvalue(), api_key='key',
+            )
+        self.assertEqual(2, len(ocr_calls))
+        self.assertEqual('둘째 쪽(캐시)', text.split('\n\n')[1])
+        self.assertEqual(200, response_data['usage']['prompt_tokens'])
+        self.assertEqual(2, len(page_store.bulk_create.call_args.args[0]))
+
+    def test_finished_page_usage_is_reported_even_if_another_page_fails(self):
+        from unittest.mock import MagicMock
+        from pypdf import PdfWriter
+        from .attachment_context import extract_text_with_openai_ocr
+
+        writer = PdfWriter()
+        for width in (200, 300):
+            writer.add_blank_page(width, 200)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+
+        page_store = MagicMock()
+        page_store.filter.return_value.values_list.return_value = []
+        calls = []
+
+        def fake_ocr(content, *, api_key, model):
+            calls.append(content)
+            if len(calls) == 2:
+                raise requests.HTTPError('500 Server Error')
+            return '첫 쪽', {'usage': {'input_tokens': 100, 'output_tokens': 10}}
+
+        reported = []
+        with patch('activities.attachment_context.AttachmentPageOCR.objects', page_store), \
+                patch('activities.attachment_context.get_ocr_parallelism', return_value=1), \
+                patch('activities.attachment_context._request_openai_ocr', side_effect=fake_ocr):
+            with self.assertRaises(requests.HTTPError):
+                extract_text_with_openai_ocr(
+                    filename='scan.pdf', data=buffer.getvalue(), api_key='key', on_usage=reported.append,
+                )
+        self.assertEqual(2, len(calls))
+        self.assertEqual([100], [data['usage']['input_tokens'] for data in reported])
+        self.assertEqual(['첫 쪽'], [row.extracted_text for row in page_store.bulk_create.call_args.args[0]])
+
+    def test_large_photo_is_rotated_downscaled_and_recompressed_before_ocr(self):
+        from PIL import Image
+        from .attachment_context import preprocess_image_for_ocr
+
+        photo = Image.effect_noise((1200, 800), 80).convert('RGB')
+        exif = photo.getexif()
+        exif[0x0112] = 6  # 90도 회전해 촬영된 사진
+        buffer = io.BytesIO()
+        photo.save(buffer, format='PNG', exif=exif)
+        processed, mime_type = preprocess_image_for_ocr(buffer.getvalue())
+        self.assertEqual('image/jpeg', mime_type)
+        self.assertLess(len(processed), len(buffer.getvalue()))
+        with Image.open(io.BytesIO(processed)) as result:
+            self.assertEqual('L', result.mode)
+            self.assertEqual((341, 512), result.size)
 
     def test_unsupported_attachment_is_rejected(self):
         with self.assertRaises(ValueError):
@@ -536,6 +699,1037 @@ class AIFeedbackPromptContractTests(SimpleTestCase):
         )
 
 
+class AnalysisJobTests(SimpleTestCase):
+    def test_job_options_keep_only_shared_analysis_settings(self):
+        options = clean_analysis_job_options({
+            'answer_id': 10,
+            'work_name': '1차 채점',
+            'batch_id': 'batch',
+            'prompt_system': '채점하세요',
+            'temperature': '0.3',
+            'tone_attributes': {'detail': 2},
+        })
+        self.assertEqual(
+            {'prompt_system': '채점하세요', 'temperature': '0.3', 'tone_attributes': {'detail': 2}},
+            options,
+        )
+
+    def test_budget_error_stops_batch_but_provider_overload_is_retryable(self):
+        budget_error = AnalysisRequestError('예산 초과', http_status=429, stops_batch=True, budget={})
+        overload_error = AnalysisRequestError('GPT 서버 과부하(429).', http_status=429, retryable=True)
+        self.assertEqual({'status': 'error', 'message': '예산 초과', 'budget': {}}, budget_error.payload)
+        self.assertTrue(budget_error.stops_batch)
+        self.assertFalse(budget_error.retryable)
+        self.assertTrue(overload_error.retryable)
+
+    def test_heartbeat_keeps_refreshing_while_one_item_runs_long(self):
+        import time
+
+        with patch('activities.analysis_jobs.get_job_heartbeat_seconds', return_value=0.01), \
+                patch('activities.analysis_jobs.connection'), \
+                patch('activities.analysis_jobs.AnalysisJob.objects') as job_store:
+            with job_heartbeat(7):
+                time.sleep(0.1)  # 답안 하나가 오래 걸리는 동안
+            time.sleep(0.02)
+            ticks = job_store.filter.return_value.update.call_count
+            time.sleep(0.05)
+            self.assertEqual(ticks, job_store.filter.return_value.update.call_count)
+        self.assertGreaterEqual(ticks, 2)
+        job_store.filter.assert_called_with(pk=7)
+
+    def test_restart_waits_for_stale_heartbeat_instead_of_taking_over_running_jobs(self):
+        from pathlib import Path
+        from django.conf import settings as django_settings
+
+        restart_script = (Path(django_settings.BASE_DIR) / 'restart.sh').read_text(encoding='utf-8')
+        self.assertIn('resume_analysis_jobs --wait', restart_script)
+        self.assertNotIn('--stale-seconds 0', restart_script)
+
+    def test_analysis_work_page_enqueues_server_job_instead_of_browser_loop(self):
+        source = get_template('activities/activity_analysis_work.html').template.source
+        self.assertIn('api_create_analysis_job', source)
+        self.assertIn('pollAnalysisJob', source)
+        self.assertNotIn("fetch('/activities/api/process-db-row/'", source)
+        self.assertEqual('/activities/api/analysis-jobs/3/', reverse('api_analysis_job_status', args=[3]))
+
+
+class PackedAnalysisTests(SimpleTestCase):
+    def make_plan(self, answer_id, answer_content='짧은 답안', question_id=1):
+        return {
+            'answer': SimpleNamespace(id=answer_id, question_id=question_id),
+            'ai_model': 'gpt-4o-mini',
+            'activity_context': '[활동 정보]',
+            'student_info': f'[대상 학생: 학생{answer_id}]',
+            'answer_content': answer_content,
+            'student_prompt': f'[대상 학생: 학생{answer_id}]\n[학생 답안 내용]\n{answer_content}',
+            'instruction_prompt': '[AI 지시사항]\n채점하세요',
+            'prompt_system': '채점하세요',
+            'effective_system_prompt': '시스템',
+            'use_cache': True,
+            'cache_key': f'key-{answer_id}',
+        }
+
+    def test_packed_prompt_shares_instruction_once_and_leaves_context_to_prefix(self):
+        prompt = build_packed_analysis_prompt([self.make_plan(1), self.make_plan(2)])
+        self.assertNotIn('[활동 정보]', prompt)
+        self.assertEqual(1, prompt.count('채점하세요'))
+        self.assertIn('[답안 ID: 1]', prompt)
+        self.assertIn('[답안 ID: 2]', prompt)
+
+    def test_parse_keeps_only_requested_non_empty_results(self):
+        content = '{"results": [{"answer_id": "1", "result": "좋아요"}, {"answer_id": 2, "result": ""}, {"answer_id": 9, "result": "남의 답"}]}'
+        self.assertEqual({1: '좋아요'}, parse_packed_analysis_results(content, {1, 2}))
+        self.assertEqual({}, parse_packed_analysis_results('{"results": [', {1}))
+
+    def test_missing_pack_results_fall_back_to_single_calls(self):
+        plans = {1: self.make_plan(1), 2: self.make_plan(2), 3: self.make_plan(3, answer_content='긴 답안' * 1000)}
+        with patch('activities.views.ai_views.build_student_analysis_plan', side_effect=lambda teacher, body: plans[body['answer_id']]), \
+                patch('activities.views.ai_views.get_cached_analysis', return_value=None), \
+                patch('activities.views.ai_views.request_packed_analysis_completion', return_value=({1: '묶음 결과'}, {})) as packed, \
+                patch('activities.views.ai_views.store_cached_analysis'), \
+                patch('activities.views.ai_views.save_student_analysis_result', side_effect=lambda plan, text, usage: {'result': text}), \
+                patch('activities.views.ai_views._complete_student_analysis', side_effect=lambda plan: {'result': f"단일 {plan['answer'].id}"}):
+            outcomes = execute_packed_student_analyses('teacher', [{'answer_id': 1}, {'answer_id': 2}, {'answer_id': 3}])
+        self.assertEqual([plans[1], plans[2]], packed.call_args.args[0])
+        self.assertEqual([{'result': '묶음 결과'}, {'result': '단일 2'}, {'result': '단일 3'}], outcomes)
+
+    def test_budget_stop_keeps_results_already_saved_in_the_pack(self):
+        budget_error = AnalysisRequestError('월 예산 초과', stops_batch=True)
+        plans = {1: self.make_plan(1, answer_content='긴 답안' * 1000), 3: self.make_plan(3)}
+
+        def build(teacher, body):
+            if body['answer_id'] == 2:
+                raise budget_error
+            return plans[body['answer_id']]
+
+        with patch('activities.views.ai_views.build_student_analysis_plan', side_effect=build), \
+                patch('activities.views.ai_views.get_cached_analysis', return_value=None), \
+                patch('activities.views.ai_views.request_packed_analysis_completion') as packed, \
+                patch('activities.views.ai_views._complete_student_analysis', side_effect=lambda plan: {'analysis_result_id': 7}):
+            outcomes = execute_packed_student_analyses('teacher', [{'answer_id': 1}, {'answer_id': 2}, {'answer_id': 3}])
+        self.assertEqual([{'analysis_result_id': 7}, budget_error, budget_error], outcomes)
+        packed.assert_not_called()
+
+    def test_packed_usage_log_records_pack_size_and_estimate_averages_per_answer(self):
+        from unittest.mock import MagicMock
+        from .models import AIUsageLog
+        from .token_estimator import PER_ANSWER_COMPLETION_TOKENS, get_expected_completion_tokens
+
+        plans = [self.make_plan(1), self.make_plan(2)]
+        for plan in plans:
+            plan.update(
+                teacher='teacher', activity=None, batch_id='b1', temperature=0.7, openai_api_key='key',
+                shared_system_prompt='공통', style_prompt='문체',
+            )
+        response = SimpleNamespace(status_code=200, json=lambda: {
+            'choices': [{'message': {'content': '{"results": []}'}}],
+            'usage': {'prompt_tokens': 1000, 'completion_tokens': 1600, 'total_tokens': 2600},
+        })
+        with patch('activities.views.ai_views.llm_request', return_value=response), \
+                patch('activities.views.ai_views.record_openai_usage', return_value={'completion_tokens': 1600}) as record:
+            request_packed_analysis_completion(plans)
+        self.assertEqual(2, record.call_args.kwargs['packed_answers'])
+
+        # 묶음 기록의 출력 토큰은 답안 수로 나눠 평균을 내야 추정치가 묶음 크기만큼 부풀지 않습니다.
+        usage_logs = MagicMock()
+        usage_logs.filter.return_value.aggregate.return_value = {'average': 800.0}
+        with patch('activities.token_estimator.AIUsageLog.objects', usage_logs):
+            self.assertEqual(800, get_expected_completion_tokens('teacher', 'gpt-4o-mini'))
+        self.assertIs(PER_ANSWER_COMPLETION_TOKENS, usage_logs.filter.return_value.aggregate.call_args.kwargs['average'])
+        per_answer_sql = str(AIUsageLog.objects.annotate(
+            per_answer=PER_ANSWER_COMPLETION_TOKENS.source_expressions[0]
+        ).values('per_answer').query)
+        self.assertIn('/ `activities_aiusagelog`.`packed_answers`', per_answer_sql)
+
+    def test_budget_stop_is_returned_for_every_unsaved_answer_in_pack(self):
+        budget_error = AnalysisRequestError('예산 초과', http_status=429, stops_batch=True)
+        with patch('activities.views.ai_views.build_student_analysis_plan', side_effect=budget_error):
+            outcomes = execute_packed_student_analyses('teacher', [{'answer_id': 1}, {'answer_id': 2}])
+        self.assertEqual([budget_error, budget_error], outcomes)
+
+
+class PromptCacheLayoutTests(SimpleTestCase):
+    def make_plan(self, style_prompt, student_prompt):
+        return {
+            'shared_system_prompt': 'TASK\n\nSCHOOL\n\nRULES\n\nCONTRACT',
+            'activity_context': '[활동 정보]' * 100,
+            'style_prompt': style_prompt,
+            'student_prompt': student_prompt,
+        }
+
+    def test_shared_prefix_stays_identical_across_students_and_tone_options(self):
+        first = build_openai_analysis_messages(self.make_plan('친절한 어조', '학생 A'), '학생 A')
+        second = build_openai_analysis_messages(self.make_plan('단호한 어조', '학생 B'), '학생 B')
+        self.assertEqual(first[:2], second[:2])
+        self.assertEqual(['system', 'user', 'system', 'user'], [message['role'] for message in first])
+        self.assertEqual('학생 A', first[-1]['content'])
+        self.assertEqual(
+            get_prompt_cache_key(self.make_plan('친절한 어조', '학생 A')),
+            get_prompt_cache_key(self.make_plan('단호한 어조', '학생 B')),
+        )
+
+    def test_style_prompt_keeps_persona_before_tone(self):
+        prompt = compose_style_prompt('PERSONA', 'TONE', 'LENGTH', 'TONE_PRESET')
+        self.assertLess(prompt.index('PERSONA'), prompt.index('TONE'))
+        self.assertIn('TONE_PRESET', prompt)
+
+    def test_cached_ratio_ignores_response_cache_hits(self):
+        logs = SimpleNamespace(filter=lambda **kwargs: SimpleNamespace(
+            aggregate=lambda **aggregates: {'prompt_tokens': 4000, 'cached_tokens': 3000, 'requests': 4}
+        ))
+        self.assertEqual(
+            {'requests': 4, 'prompt_tokens': 4000, 'cached_tokens': 3000, 'cached_ratio': 0.75},
+            get_prompt_cache_stats(logs),
+        )
+
+
+class CompiledSystemPromptTests(SimpleTestCase):
+    def setUp(self):
+        clear_compiled_prompts()
+        self.addCleanup(clear_compiled_prompts)
+        self.teacher = SimpleNamespace(
+            pk=1,
+            subject=SimpleNamespace(name='국어'),
+            school=SimpleNamespace(name='메타고', level='high'),
+        )
+
+    def options(self, **overrides):
+        options = {
+            'requested_task_type': 'feedback',
+            'selected_persona_id': None,
+            'requested_teacher_types': [],
+            'selected_teacher_types': [],
+            'selected_tone': 'friendly',
+            'tone_attributes': {'warmth': 3},
+            'requested_length': 'medium',
+            'feedback_components': ['strength'],
+        }
+        options.update(overrides)
+        return options
+
+    @patch('activities.views.ai_views.compile_analysis_system_prompt')
+    def test_same_options_reuse_compiled_prompt(self, compile_prompt):
+        compile_prompt.return_value = {'effective_system_prompt': 'SYSTEM'}
+        get_compiled_system_prompt(self.teacher, **self.options())
+        get_compiled_system_prompt(self.teacher, **self.options())
+        self.assertEqual(1, compile_prompt.call_count)
+
+        get_compiled_system_prompt(self.teacher, **self.options(tone_attributes={'warmth': 4}))
+        self.assertEqual(2, compile_prompt.call_count)
+
+    @patch('activities.views.ai_views.compile_analysis_system_prompt')
+    def test_persona_change_signal_clears_compiled_prompts(self, compile_prompt):
+        compile_prompt.return_value = {'effective_system_prompt': 'SYSTEM'}
+        get_compiled_system_prompt(self.teacher, **self.options())
+        clear_compiled_prompts_on_change(sender=None)
+        get_compiled_system_prompt(self.teacher, **self.options())
+        self.assertEqual(2, compile_prompt.call_count)
+
+    @patch('activities.views.ai_views.compile_analysis_system_prompt')
+    def test_compile_errors_are_not_memoized(self, compile_prompt):
+        compile_prompt.side_effect = [AnalysisRequestError('권한 없음'), {'effective_system_prompt': 'SYSTEM'}]
+        with self.assertRaises(AnalysisRequestError):
+            get_compiled_system_prompt(self.teacher, **self.options())
+        self.assertEqual('SYSTEM', get_compiled_system_prompt(self.teacher, **self.options())['effective_system_prompt'])
+
+
+class FairShareSchedulerTests(SimpleTestCase):
+    def enqueue(self, scheduler, granted, name, teacher_id, lane, cost=100):
+        return scheduler._enqueue(teacher_id, lane, cost, lambda: granted.append(name))
+
+    def test_interactive_request_uses_reserved_slot_while_batch_is_capped(self):
+        scheduler = FairShareScheduler(capacity=3, per_teacher_limit=2, interactive_reserved=1)
+        granted = []
+        first = self.enqueue(scheduler, granted, 'a1', 'teacher-a', BATCH)
+        self.enqueue(scheduler, granted, 'a2', 'teacher-a', BATCH)
+        self.enqueue(scheduler, granted, 'a3', 'teacher-a', BATCH)
+        self.enqueue(scheduler, granted, 'b1', 'teacher-b', BATCH)
+        self.enqueue(scheduler, granted, 'c1', 'teacher-c', INTERACTIVE)
+        self.assertEqual(['a1', 'a2', 'c1'], granted)
+
+        # 먼저 많이 쓴 교사 A보다 기다리던 교사 B가 다음 슬롯을 받습니다.
+        scheduler.release(first)
+        self.assertEqual(['a1', 'a2', 'c1', 'b1'], granted)
+        self.assertEqual({'running': 3, 'running_batch': 2, 'waiting': 1}, scheduler.snapshot())
+
+    def test_nested_slot_and_unmarked_calls_pass_through(self):
+        scheduler = FairShareScheduler(capacity=1, per_teacher_limit=1)
+        with patch('activities.llm_scheduler.get_llm_scheduler', return_value=scheduler):
+            with llm_slot():
+                self.assertEqual(0, scheduler.snapshot()['running'])
+            with llm_caller(7, INTERACTIVE), llm_slot(500):
+                with llm_slot(500):
+                    self.assertEqual(1, scheduler.snapshot()['running'])
+        self.assertEqual(0, scheduler.snapshot()['running'])
+
+
+class IdempotentAnalysisRequestTests(SimpleTestCase):
+    def test_key_comes_from_header_or_body(self):
+        request = RequestFactory().post('/', HTTP_IDEMPOTENCY_KEY='12:side_peek_1')
+        self.assertEqual('12:side_peek_1', get_request_idempotency_key(request, {'idempotency_key': 'other'}))
+        self.assertEqual('12:b', get_request_idempotency_key(RequestFactory().post('/'), {'idempotency_key': ' 12:b '}))
+        self.assertEqual('', get_request_idempotency_key(RequestFactory().post('/'), {}))
+
+    @patch('activities.views.ai_views.await_idempotent_response')
+    @patch('activities.views.ai_views.claim_idempotency_key')
+    def test_retry_attaches_to_completed_call(self, claim, await_response):
+        claim.return_value = (SimpleNamespace(pk=1), False)
+        await_response.return_value = (True, {'status': 'success', 'result': '앞선 결과'})
+        record, response_body = async_to_sync(claim_or_attach_idempotent_request)('teacher', '12:b')
+        self.assertIsNone(record)
+        self.assertEqual('앞선 결과', response_body['result'])
+
+    @patch('activities.views.ai_views.await_idempotent_response')
+    @patch('activities.views.ai_views.claim_idempotency_key')
+    def test_retry_takes_over_failed_call_and_gives_up_on_slow_one(self, claim, await_response):
+        owned = SimpleNamespace(pk=1)
+        claim.side_effect = [(owned, False), (owned, True)]
+        await_response.return_value = (True, None)
+        self.assertEqual((owned, None), async_to_sync(claim_or_attach_idempotent_request)('teacher', '12:b'))
+
+        claim.side_effect = None
+        claim.return_value = (owned, False)
+        await_response.return_value = (False, None)
+        with self.assertRaises(AnalysisRequestError) as raised:
+            async_to_sync(claim_or_attach_idempotent_request)('teacher', '12:b')
+        self.assertEqual(409, raised.exception.http_status)
+
+    def test_retried_request_does_not_call_model_again(self):
+        request = RequestFactory().post(
+            '/activities/api/process-db-row/', data='{"idempotency_key": "12:b"}', content_type='application/json'
+        )
+        request.user = SimpleNamespace(pk=3, is_authenticated=True, role='TEACHER', is_approved=True)
+        attached = {'status': 'success', 'result': '앞선 결과'}
+        with patch('activities.views.ai_views.claim_or_attach_idempotent_request', AsyncMock(return_value=(None, attached))), \
+                patch('activities.views.ai_views.aexecute_student_analysis', AsyncMock()) as execute:
+            response = async_to_sync(api_process_db_row)(request)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('앞선 결과', json.loads(response.content)['result'])
+        execute.assert_not_awaited()
+
+
+class DeltaReanalysisTests(SimpleTestCase):
+    def test_content_hash_ignores_metadata_only_saves(self):
+        analyzed_at = datetime(2026, 3, 2, 9, 0, tzinfo=dt_timezone.utc)
+        previous = SimpleNamespace(source_hash=answer_content_hash('처음 답안'), created_at=analyzed_at)
+        # AI 결과 기록·교사 메모 저장으로 updated_at만 바뀐 답안은 그대로로 봅니다.
+        touched = SimpleNamespace(display_content='처음 답안', updated_at=datetime(2026, 3, 5, tzinfo=dt_timezone.utc))
+        edited = SimpleNamespace(display_content='고친 답안', updated_at=datetime(2026, 3, 5, tzinfo=dt_timezone.utc))
+        self.assertFalse(is_answer_changed(touched, previous))
+        self.assertTrue(is_answer_changed(edited, previous))
+
+    def test_results_without_hash_fall_back_to_updated_at(self):
+        analyzed_at = datetime(2026, 3, 2, 9, 0, tzinfo=dt_timezone.utc)
+        previous = SimpleNamespace(source_hash='', created_at=analyzed_at)
+        self.assertFalse(is_answer_changed(SimpleNamespace(updated_at=datetime(2026, 3, 1, tzinfo=dt_timezone.utc)), previous))
+        self.assertTrue(is_answer_changed(SimpleNamespace(updated_at=datetime(2026, 3, 3, tzinfo=dt_timezone.utc)), previous))
+
+    def test_result_made_with_other_settings_is_reanalyzed(self):
+        from unittest.mock import MagicMock
+
+        def previous(answer_id, **overrides):
+            fields = {'answer_id': answer_id, 'source_hash': answer_content_hash('답안'), 'prompt_system': '시스템\n\n[교사 분석 지시]\n채점',
+                      'ai_model': 'gpt-4o-mini', 'temperature': 0.7}
+            return SimpleNamespace(**{**fields, **overrides})
+
+        answers = [SimpleNamespace(id=answer_id, display_content='답안') for answer_id in (1, 2, 3, 4)]
+        results = [previous(1), previous(2, prompt_system='시스템\n\n[교사 분석 지시]\n다른 지시'),
+                   previous(3, ai_model='gpt-4o'), previous(4, temperature=0.2)]
+        answer_store, result_store = MagicMock(), MagicMock()
+        answer_store.filter.return_value.select_related.return_value = answers
+        result_store.filter.return_value.order_by.return_value = results
+        with patch('activities.delta_analysis.Answer.objects', answer_store), \
+                patch('activities.delta_analysis.AnalysisResult.objects', result_store):
+            changed_ids, unchanged = split_changed_answers('activity', '1차', [1, 2, 3, 4], result_settings={
+                'prompt_system': '시스템\n\n[교사 분석 지시]\n채점', 'ai_model': 'gpt-4o-mini', 'temperature': 0.7,
+            })
+        self.assertEqual([2, 3, 4], changed_ids)
+        self.assertEqual([1], list(unchanged))
+
+    def test_empty_job_copies_no_previous_results(self):
+        from unittest.mock import MagicMock
+
+        answer_store = MagicMock()
+        answer_store.filter.return_value.order_by.return_value.values_list.return_value = []
+        with patch('activities.analysis_jobs.Answer.objects', answer_store), \
+                patch('activities.analysis_jobs.AnalysisJob.objects') as job_store, \
+                patch('activities.analysis_jobs.copy_forward_results') as copy_forward:
+            job = create_analysis_job(
+                activity='activity', teacher='teacher', work_name='1차', batch_id='b', answer_ids=[],
+                options={}, unchanged_results={9: SimpleNamespace()},
+            )
+        self.assertIsNone(job)
+        copy_forward.assert_not_called()
+        job_store.create.assert_not_called()
+
+    def test_work_page_sends_changed_only_option(self):
+        source = get_template('activities/activity_analysis_work.html').template.source
+        self.assertIn('id="changed_only"', source)
+        self.assertIn("'changed_only': changedOnly", source)
+
+
+class NearDuplicateClusterTests(SimpleTestCase):
+    ESSAY = '지구 온난화는 온실가스 배출 증가로 지구의 평균 기온이 오르는 현상이므로 재생에너지를 늘려야 한다.'
+    OTHER = '소설의 주인공이 가족을 위해 희생하는 모습에서 책임감의 의미를 다시 생각하게 되었다.'
+
+    def test_near_identical_answers_share_first_answer_as_representative(self):
+        texts = [
+            self.ESSAY,
+            self.OTHER,
+            '  ' + self.ESSAY.replace('늘려야', '확대해야') + '\n',
+            '',
+            self.OTHER + '!',
+            self.ESSAY.upper(),
+        ]
+        self.assertEqual([0, 1, 0, -1, 1, 0], find_near_duplicate_groups(texts, threshold=0.8).tolist())
+
+    def test_dissimilar_answers_stay_separate_at_strict_threshold(self):
+        labels = find_near_duplicate_groups([self.ESSAY, self.OTHER, self.ESSAY[:20]], threshold=0.95)
+        self.assertEqual([0, 1, 2], labels.tolist())
+
+    def test_long_unrelated_answers_stay_in_separate_clusters(self):
+        import random
+
+        generator = random.Random(1)
+        syllables = [chr(code) for code in range(0xAC00, 0xAC00 + 800)] + [' '] * 60
+        first, second = (''.join(generator.choice(syllables) for _ in range(5000)) for _ in range(2))
+        self.assertEqual([0, 1], find_near_duplicate_groups([first, second]).tolist())
+        self.assertEqual([0, 0], find_near_duplicate_groups([first, first[:-20]]).tolist())
+
+    def test_cluster_assignment_returns_representative_per_answer(self):
+        answers = [
+            SimpleNamespace(id=1, display_content=self.ESSAY),
+            SimpleNamespace(id=2, display_content=self.OTHER),
+            SimpleNamespace(id=3, display_content=self.ESSAY + '.'),
+        ]
+        self.assertEqual({1: 1, 2: 2, 3: 1}, cluster_answers(answers, threshold=0.9))
+
+    def test_result_page_reads_saved_job_mapping_instead_of_reclustering(self):
+        jobs = [
+            ('행발', 'b1', {'3': 1, '5': 1}),
+            ('행발', 'b2', {}),
+        ]
+        with patch('activities.answer_clusters.AnalysisJob.objects') as job_store, \
+                patch('activities.answer_clusters.find_near_duplicate_groups') as recluster:
+            job_store.filter.return_value.order_by.return_value.values_list.return_value = jobs
+            saved_maps = get_saved_representative_maps(activity=None)
+        recluster.assert_not_called()
+        self.assertEqual({('행발', 'b1'): {3: 1, 5: 1}}, saved_maps)
+
+        clusters = describe_answer_clusters(saved_maps[('행발', 'b1')], {1: '김하나'})
+        self.assertEqual({1, 3, 5}, set(clusters))
+        self.assertTrue(clusters[1]['is_representative'])
+        self.assertEqual({'number': 1, 'size': 3, 'representative_id': 1, 'representative_name': '김하나',
+                          'is_representative': False}, clusters[3])
+
+    def test_work_page_offers_representatives_only_for_copy_allowed_activities(self):
+        source = get_template('activities/activity_analysis_work.html').template.source
+        self.assertIn("activity.exam_mode == 'OPEN_FREE'", source)
+        self.assertIn("'representatives_only': representativesOnly", source)
+
+
+class MonthlySpendLedgerTests(SimpleTestCase):
+    def test_budget_check_reads_ledger_instead_of_summing_usage_logs(self):
+        budget_config = SimpleNamespace(value='10')
+        with patch('activities.views.ai_views.SystemConfig.objects.filter') as config_filter, \
+                patch('activities.views.ai_views.get_monthly_spend', return_value=Decimal('7.5')) as ledger, \
+                patch('activities.views.ai_views.AIUsageLog.objects.filter') as usage_filter:
+            config_filter.return_value.first.return_value = budget_config
+            status = get_monthly_ai_budget_status('teacher')
+        self.assertEqual({'budget': Decimal('10'), 'spent': Decimal('7.5'), 'remaining': Decimal('2.5')}, status)
+        ledger.assert_called_once_with('teacher')
+        usage_filter.assert_not_called()
+
+    def test_record_openai_usage_adds_cost_to_monthly_ledger(self):
+        response_data = {'usage': {'prompt_tokens': 1000, 'completion_tokens': 500, 'total_tokens': 1500}}
+        with patch('activities.attachment_context.transaction.atomic'), \
+                patch('activities.attachment_context.AIUsageLog.objects.create'), \
+                patch('activities.attachment_context.add_monthly_spend') as add_spend:
+            usage = record_openai_usage(
+                teacher='teacher', activity=None, answer=None, operation='STUDENT_ANALYSIS',
+                model='gpt-4o-mini', response_data=response_data,
+            )
+        add_spend.assert_called_once_with('teacher', Decimal(usage['estimated_cost_usd']))
+
+    def test_month_start_uses_local_calendar_month(self):
+        # 2025-03-31 16:00 UTC는 서울 기준 4월 1일입니다.
+        moment = datetime(2025, 3, 31, 16, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(date(2025, 4, 1), month_start(moment))
+
+
+class AnalysisCostEstimatorTests(SimpleTestCase):
+    def test_fallback_token_count_treats_hangul_as_one_token_per_char(self):
+        with patch('activities.token_estimator._get_encoding', return_value=None):
+            self.assertEqual(4 + 2, count_tokens('학생 답안 abcd'))
+            self.assertEqual(0, count_tokens(''))
+
+    def test_batch_estimate_counts_context_once_per_question_and_skips_empty_answers(self):
+        question = SimpleNamespace(id=1)
+        answers = [
+            SimpleNamespace(question_id=1, question=question, display_content='가나다'),
+            SimpleNamespace(question_id=1, question=question, display_content='라마'),
+            SimpleNamespace(question_id=1, question=question, display_content=''),
+        ]
+        with patch('activities.token_estimator._get_encoding', return_value=None), \
+                patch('activities.token_estimator.peek_analysis_ready_context', return_value=('맥락' * 50, '')) as peek, \
+                patch('activities.token_estimator.get_expected_completion_tokens', return_value=1000), \
+                patch('activities.token_estimator.SYSTEM_PROMPT_OVERHEAD_TOKENS', 0), \
+                patch('activities.token_estimator.PROMPT_FRAMING_TOKENS', 0):
+            estimate = estimate_analysis_batch(
+                activity=None, teacher=None, answers=answers, system_prompt='', instruction='', model='gpt-4o-mini',
+            )
+        peek.assert_called_once()
+        self.assertEqual(2, estimate['answer_count'])
+        self.assertEqual(100 * 2 + 3 + 2, estimate['prompt_tokens'])
+        self.assertEqual(2000, estimate['completion_tokens'])
+        self.assertEqual(estimate_openai_cost_usd('gpt-4o-mini', {
+            'prompt_tokens': 205, 'completion_tokens': 2000,
+        }), estimate['estimated_cost_usd'])
+
+    def test_batch_estimate_lists_truncated_attachments(self):
+        truncated = SimpleNamespace(filename='교과서.pdf', extraction_stop_reason='쪽수 한도(200쪽)', extracted_char_count=98000)
+        files = SimpleNamespace(exclude=lambda **kwargs: SimpleNamespace(only=lambda *fields: [truncated]))
+        with patch('activities.token_estimator._get_encoding', return_value=None), \
+                patch('activities.token_estimator.get_expected_completion_tokens', return_value=1000):
+            estimate = estimate_analysis_batch(
+                activity=SimpleNamespace(files=files), teacher=None, answers=[],
+                system_prompt='', instruction='', model='gpt-4o-mini',
+            )
+        self.assertEqual([{
+            'filename': '교과서.pdf', 'stop_reason': '쪽수 한도(200쪽)', 'extracted_char_count': 98000,
+        }], estimate['truncated_attachments'])
+
+    def test_estimate_is_compared_with_remaining_budget(self):
+        estimate = {'estimated_cost_usd': Decimal('1.5')}
+        self.assertTrue(estimate_exceeds_budget(estimate, {'remaining': Decimal('1.0')}))
+        self.assertFalse(estimate_exceeds_budget(estimate, {'remaining': Decimal('2.0')}))
+        self.assertFalse(estimate_exceeds_budget(estimate, None))
+
+    def test_work_page_checks_estimate_before_creating_job(self):
+        source = get_template('activities/activity_analysis_work.html').template.source
+        self.assertIn('api_estimate_analysis_job', source)
+        self.assertLess(source.index('api_estimate_analysis_job'), source.index('api_create_analysis_job'))
+
+
+@patch('activities.locks.connection', SimpleNamespace(vendor='sqlite'))
+class SingleFlightLockTests(SimpleTestCase):
+    def test_second_caller_waits_until_first_finishes(self):
+        import threading
+
+        events = []
+        first_entered = threading.Event()
+        release_first = threading.Event()
+
+        def first():
+            with single_flight('test:activity-context:1'):
+                events.append('first-start')
+                first_entered.set()
+                release_first.wait(2)
+                events.append('first-end')
+
+        def second():
+            first_entered.wait(2)
+            with single_flight('test:activity-context:1'):
+                events.append('second')
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        first_entered.wait(2)
+        release_first.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(['first-start', 'first-end', 'second'], events)
+
+    def test_same_thread_can_reenter(self):
+        with single_flight('test:activity-context:2'):
+            with single_flight('test:activity-context:2'):
+                entered = True
+        self.assertTrue(entered)
+
+
+class AttachmentStatFastPathTests(SimpleTestCase):
+    def make_file(self, **overrides):
+        from datetime import datetime, timezone as dt_timezone
+        from .models import ActivityFile
+
+        modified_at = datetime(2026, 3, 2, 9, 0, tzinfo=dt_timezone.utc)
+        storage = SimpleNamespace(size=lambda name: 2048, get_modified_time=lambda name: modified_at)
+
+        def fail_open(*args, **kwargs):
+            raise AssertionError('첨부파일을 다시 읽으면 안 됩니다.')
+
+        values = {
+            'pk': 99,
+            'filename': 'guide.pdf',
+            'file': SimpleNamespace(name='activity_files/guide.pdf', storage=storage, open=fail_open, size=2048),
+            'content_hash': 'a' * 64,
+            'extraction_status': ActivityFile.ExtractionStatus.READY,
+            'source_name': 'activity_files/guide.pdf',
+            'source_size': 2048,
+            'source_modified_at': modified_at,
+        }
+        values.update(overrides)
+        return SimpleNamespace(**values)
+
+    def test_unchanged_stat_skips_reading_file_bytes(self):
+        activity_file = self.make_file()
+        self.assertIs(activity_file, ensure_activity_file_extracted(activity_file))
+
+    def test_changed_size_falls_back_to_reading_file(self):
+        from .models import ActivityFile
+
+        saved_fields = []
+        activity_file = self.make_file(
+            pk=100, source_size=1, save=lambda update_fields: saved_fields.extend(update_fields),
+        )
+        ensure_activity_file_extracted(activity_file)
+        self.assertEqual(ActivityFile.ExtractionStatus.ERROR, activity_file.extraction_status)
+        self.assertIn('다시 읽으면', activity_file.extraction_error)
+
+    @patch('activities.attachment_context.MAX_PDF_PAGES', 1)
+    def test_scanned_pdf_stopped_at_page_limit_still_goes_to_ocr(self):
+        from unittest.mock import MagicMock
+        from pypdf import PdfWriter
+
+        writer = PdfWriter()
+        for _ in range(2):
+            writer.add_blank_page(200, 200)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        activity_file = self.make_file(
+            pk=102, source_size=1, save=lambda update_fields: None, activity=SimpleNamespace(),
+        )
+        file_store = MagicMock()
+        file_store.filter.return_value.exclude.return_value.order_by.return_value.first.return_value = None
+        with patch('activities.attachment_context._read_file_bytes', return_value=buffer.getvalue()), \
+                patch('activities.attachment_context.ActivityFile.objects', file_store), \
+                patch('activities.attachment_context.extract_text_with_openai_ocr', return_value=('스캔 본문', None)) as ocr:
+            ensure_activity_file_extracted(activity_file, api_key='key', teacher='교사')
+        ocr.assert_called_once()
+        self.assertEqual('스캔 본문', activity_file.extracted_text)
+        self.assertEqual('READY', activity_file.extraction_status)
+        self.assertEqual('', activity_file.extraction_stop_reason)
+
+    @patch('activities.attachment_context.MAX_EXTRACTED_CHARS_PER_FILE', 10)
+    def test_truncation_marker_is_kept_after_character_limit_cut(self):
+        from unittest.mock import MagicMock
+
+        activity_file = self.make_file(
+            pk=103, filename='guide.txt', source_size=1, save=lambda update_fields: None,
+        )
+        file_store = MagicMock()
+        file_store.filter.return_value.exclude.return_value.order_by.return_value.first.return_value = None
+        with patch('activities.attachment_context._read_file_bytes', return_value=('가' * 30).encode('utf-8')), \
+                patch('activities.attachment_context.ActivityFile.objects', file_store):
+            ensure_activity_file_extracted(activity_file)
+        self.assertTrue(activity_file.extracted_text.startswith('가' * 10 + '\n\n'))
+        self.assertTrue(activity_file.extracted_text.endswith('[글자 수 한도(10자)에 도달해 이후 내용은 생략됨]'))
+        self.assertEqual('글자 수 한도(10자)', activity_file.extraction_stop_reason)
+        self.assertEqual(10, activity_file.extracted_char_count)
+
+    def test_ocr_page_limit_is_recorded_as_stop_reason(self):
+        from unittest.mock import MagicMock
+        from .attachment_context import OCR_PAGE_LIMIT_REASON, _mark_truncated
+
+        activity_file = self.make_file(
+            pk=104, source_size=1, save=lambda update_fields: None, activity=SimpleNamespace(),
+        )
+        file_store = MagicMock()
+        file_store.filter.return_value.exclude.return_value.order_by.return_value.first.return_value = None
+        ocr_text = _mark_truncated('스캔 본문', OCR_PAGE_LIMIT_REASON)
+        with patch('activities.attachment_context._read_file_bytes', return_value=b'%PDF-1.4'), \
+                patch('activities.attachment_context.extract_text_from_upload', return_value=('', '')), \
+                patch('activities.attachment_context.ActivityFile.objects', file_store), \
+                patch('activities.attachment_context.extract_text_with_openai_ocr', return_value=(ocr_text, None)):
+            ensure_activity_file_extracted(activity_file, api_key='key', teacher='교사')
+        self.assertEqual(OCR_PAGE_LIMIT_REASON, activity_file.extraction_stop_reason)
+
+
+    def test_hash_match_copies_text_and_records_avoided_ocr_cost(self):
+        from decimal import Decimal
+        from .attachment_context import _copy_extraction_from
+
+        activity_file = self.make_file(
+            pk=101, extraction_status='PENDING', activity=SimpleNamespace(teacher='교사'),
+            ocr_bytes_saved=52_000, save=lambda update_fields: None,
+        )
+        donor = SimpleNamespace(
+            extracted_text='학습지 본문', extracted_char_count=6, extraction_stop_reason='',
+            ocr_cost_usd=Decimal('0.0042'), ocr_bytes_saved=0,
+        )
+        with patch('activities.attachment_context.AIUsageLog.objects.create') as create_log:
+            _copy_extraction_from(activity_file, donor, 'b' * 64, {'source_name': 'x', 'source_size': 1, 'source_modified_at': None})
+        self.assertEqual('학습지 본문', activity_file.extracted_text)
+        self.assertEqual('READY', activity_file.extraction_status)
+        self.assertEqual('b' * 64, activity_file.content_hash)
+        self.assertEqual(0, activity_file.ocr_bytes_saved)
+        self.assertTrue(create_log.call_args.kwargs['is_cache_hit'])
+        self.assertEqual(Decimal('0.0042'), create_log.call_args.kwargs['saved_cost_usd'])
+
+
+class AttachmentRetrievalTests(SimpleTestCase):
+    def test_chunks_respect_target_size_and_keep_paragraph_text(self):
+        text = '\n\n'.join(f'{index}번 문단 ' + '가' * 300 for index in range(6))
+        chunks = chunk_text(text, target_chars=700)
+        self.assertTrue(all(len(chunk) <= 700 for chunk in chunks))
+        self.assertIn('5번 문단', chunks[-1])
+
+    def test_korean_query_finds_passage_despite_particles(self):
+        index = BM25Index(build_passages([
+            ('학습지.pdf', '광합성은 빛에너지를 이용해 포도당을 만드는 과정이다.\n\n' + '세포 분열 설명 ' * 80),
+            ('부록.pdf', '기체 교환과 호흡에 관한 참고 자료'),
+        ]))
+        passages = index.search('광합성의 원리를 설명하시오', top_k=1)
+        self.assertEqual(1, len(passages))
+        self.assertEqual('학습지.pdf', passages[0][0])
+        self.assertIn('광합성은', passages[0][1])
+
+
+    def test_context_mode_tells_retrieval_apart_from_summary(self):
+        long_cache = SimpleNamespace(structured_context='자료 ' * 5000, summary_text='요약', summary_model='gpt-4o-mini')
+        kwargs = {'activity': SimpleNamespace(pk=1), 'question': None, 'teacher': None, 'api_key': 'key'}
+
+        with patch('activities.attachment_context.get_or_refresh_activity_context',
+                   return_value=SimpleNamespace(structured_context='짧은 자료')):
+            self.assertEqual(CONTEXT_MODE_DIRECT, _get_analysis_ready_context(**kwargs)[2])
+        with patch('activities.attachment_context.get_or_refresh_activity_context', return_value=long_cache), \
+                patch('activities.attachment_context.build_retrieval_context', return_value='관련 발췌'):
+            context, _, mode = _get_analysis_ready_context(**kwargs)
+        self.assertEqual(('관련 발췌', CONTEXT_MODE_RETRIEVAL), (context, mode))
+        with override_settings(AI_ATTACHMENT_CONTEXT_MODE='summary'), \
+                patch('activities.attachment_context.get_or_refresh_activity_context', return_value=long_cache):
+            context, _, mode = _get_analysis_ready_context(**kwargs)
+        self.assertEqual(('요약', CONTEXT_MODE_SUMMARY), (context, mode))
+
+    def test_verbatim_context_keeps_header_and_caps_attachments(self):
+        short = '[활동 기본 정보]\n[첨부자료 추출 내용]\n짧은 본문'
+        self.assertEqual(short, cap_verbatim_context(short))
+        capped = cap_verbatim_context('[활동 기본 정보]\n[첨부자료 추출 내용]\n' + '가' * 100_000)
+        self.assertTrue(capped.startswith('[활동 기본 정보]'))
+        self.assertLess(len(capped), MAX_ATTACHMENT_CONTEXT_CHARS + 200)
+        self.assertTrue(capped.endswith('생략됨]'))
+
+class MapReduceSummaryTests(SimpleTestCase):
+    def fake_summary(self, calls):
+        def request(text, *, api_key, model, instruction=''):
+            calls.append(text)
+            return f'요약{len(calls)}', {'usage': {'prompt_tokens': 10, 'completion_tokens': 2}}
+        return request
+
+    def test_long_context_is_summarized_by_chunks_then_merged(self):
+        text = '\n\n'.join(f'[첨부파일: {index}.pdf]\n' + '내용 ' * 2500 for index in range(4))
+        calls = []
+        with patch('activities.attachment_context._request_context_summary', side_effect=self.fake_summary(calls)):
+            summary, usage, chunk_summaries = summarize_activity_context(text, api_key='key', model='gpt-4o-mini')
+        self.assertGreater(len(chunk_summaries), 1)
+        self.assertEqual(len(chunk_summaries) + 1, len(calls))
+        self.assertEqual(f'요약{len(calls)}', summary)
+        self.assertEqual(10 * len(calls), usage['prompt_tokens'])
+
+    def test_only_changed_chunks_are_resummarized(self):
+        parts = ['[첨부파일: 1.pdf]\n' + '가나 ' * 3000, '[첨부파일: 2.pdf]\n' + '다라 ' * 3000, '[첨부파일: 3.pdf]\n' + '마바 ' * 3000]
+        first_calls = []
+        with patch('activities.attachment_context._request_context_summary', side_effect=self.fake_summary(first_calls)):
+            _, _, chunk_summaries = summarize_activity_context('\n\n'.join(parts), api_key='key', model='gpt-4o-mini')
+        # 앞쪽 첨부를 고쳐도 뒤 첨부 조각의 경계·해시는 그대로여야 합니다.
+        parts[0] = '[첨부파일: 1.pdf]\n' + '사아 ' * 3500
+        second_calls = []
+        with patch('activities.attachment_context._request_context_summary', side_effect=self.fake_summary(second_calls)):
+            summarize_activity_context(
+                '\n\n'.join(parts), api_key='key', model='gpt-4o-mini', cached_chunk_summaries=dict(chunk_summaries),
+            )
+        self.assertLess(len(second_calls), len(first_calls))
+        self.assertTrue(all('다라' not in call and '마바' not in call for call in second_calls[:-1]))
+
+    def test_finished_chunk_usage_is_recorded_even_if_another_chunk_fails(self):
+        parts = ['[첨부파일: 1.pdf]\n' + '가나 ' * 3000, '[첨부파일: 2.pdf]\n' + '다라 ' * 3000, '[첨부파일: 3.pdf]\n' + '마바 ' * 3000]
+        calls = []
+        succeed = self.fake_summary(calls)
+
+        def request(text, **kwargs):
+            if '마바' in text:
+                raise RuntimeError('요약 실패')
+            return succeed(text, **kwargs)
+
+        recorded = []
+        store = {}
+        with patch('activities.attachment_context._request_context_summary', side_effect=request):
+            with self.assertRaises(RuntimeError):
+                summarize_activity_context(
+                    '\n\n'.join(parts), api_key='key', model='gpt-4o-mini',
+                    cached_chunk_summaries=store, on_usage=recorded.append,
+                )
+        self.assertEqual(len(calls), len(recorded))
+        self.assertGreater(len(recorded), 0)
+        self.assertEqual(len(calls), len(store))
+
+
+class PerQuestionContextCacheTests(SimpleTestCase):
+    def test_context_cache_is_looked_up_per_question(self):
+        from .attachment_context import _get_or_refresh_activity_context
+
+        activity = SimpleNamespace(pk=1)
+        question = SimpleNamespace(pk=2)
+        cache = SimpleNamespace(source_fingerprint='', structured_context='', save=lambda update_fields: None)
+        with patch('activities.attachment_context.build_structured_activity_context', return_value='문항 2 컨텍스트'), \
+                patch('activities.attachment_context.ActivityAnalysisContext.objects.get_or_create',
+                      return_value=(cache, True)) as get_or_create:
+            _get_or_refresh_activity_context(activity, question)
+        self.assertIs(question, get_or_create.call_args.kwargs['question'])
+        self.assertEqual('문항 2 컨텍스트', cache.structured_context)
+
+
+class ActivityContextWarmupTests(SimpleTestCase):
+    def test_warmup_runs_in_background_after_commit(self):
+        with patch('activities.attachment_context.transaction.on_commit', side_effect=lambda callback: callback()), \
+                patch('activities.attachment_context.run_in_background') as run_in_background:
+            schedule_activity_context_warmup(SimpleNamespace(pk=7))
+        run_in_background.assert_called_once_with(warm_activity_context, 7)
+
+
+class AIResponseCacheKeyTests(SimpleTestCase):
+    def make_plan(self, **overrides):
+        plan = {
+            'ai_model': 'gpt-4o-mini',
+            'temperature': 0.7,
+            'effective_system_prompt': '시스템',
+            'final_prompt': '[학생 답안 내용]\n답안',
+            'work_name': '1차 채점',
+            'batch_id': 'batch-1',
+        }
+        plan.update(overrides)
+        return plan
+
+    def test_key_ignores_work_name_and_batch_but_tracks_model_inputs(self):
+        base_key = build_analysis_cache_key(self.make_plan())
+        self.assertEqual(base_key, build_analysis_cache_key(self.make_plan(work_name='2차', batch_id='batch-2')))
+        self.assertNotEqual(base_key, build_analysis_cache_key(self.make_plan(temperature=0.3)))
+        self.assertNotEqual(base_key, build_analysis_cache_key(self.make_plan(final_prompt='[학생 답안 내용]\n수정')))
+        self.assertNotEqual(base_key, build_analysis_cache_key(self.make_plan(ai_model='claude-3')))
+
+
+class StreamingAnalysisTests(SimpleTestCase):
+    class FakeStreamResponse:
+        status_code = 200
+
+        def __init__(self, lines):
+            self.lines = lines
+            self.closed = False
+
+        def iter_lines(self, decode_unicode=False):
+            return iter(self.lines)
+
+        def close(self):
+            self.closed = True
+
+    def test_claude_stream_yields_text_deltas_and_keeps_full_result(self):
+        response = self.FakeStreamResponse([
+            'event: message_start',
+            'data: {"type": "message_start"}',
+            '',
+            'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "잘 "}}',
+            'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "썼어요"}}',
+            'data: {"type": "message_stop"}',
+        ])
+        plan = {'ai_model': 'claude-test', 'temperature': 0.5, 'final_prompt': '분석'}
+        stream_state = {}
+        with patch('activities.views.ai_views.SystemConfig.objects.get', return_value=SimpleNamespace(value='key')), \
+                patch('activities.views.ai_views.llm_request', return_value=response) as post:
+            chunks = list(stream_student_analysis_completion(plan, stream_state))
+        self.assertEqual(['잘 ', '썼어요'], chunks)
+        self.assertEqual('잘 썼어요', stream_state['result_text'])
+        self.assertTrue(post.call_args.kwargs['json']['stream'])
+        self.assertEqual('key', post.call_args.kwargs['api_keys'])
+        self.assertNotIn('x-api-key', post.call_args.kwargs['headers'])
+        self.assertTrue(response.closed)
+
+    def test_async_stream_matches_sync_stream_for_claude(self):
+        class FakeAsyncStreamResponse:
+            status_code = 200
+            closed = False
+
+            async def aiter_lines(self):
+                for line in [
+                    'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "잘 "}}',
+                    'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "썼어요"}}',
+                ]:
+                    yield line
+
+            async def aclose(self):
+                self.closed = True
+
+        async def collect(plan, stream_state):
+            return [text async for text in astream_student_analysis_completion(plan, stream_state)]
+
+        response = FakeAsyncStreamResponse()
+        plan = {'ai_model': 'claude-test', 'temperature': 0.5, 'final_prompt': '분석'}
+        stream_state = {}
+        with patch('activities.views.ai_views.SystemConfig.objects.get', return_value=SimpleNamespace(value='key')), \
+                patch('activities.views.ai_views.allm_request', AsyncMock(return_value=response)) as post:
+            chunks = async_to_sync(collect)(plan, stream_state)
+        self.assertEqual(['잘 ', '썼어요'], chunks)
+        self.assertEqual('잘 썼어요', stream_state['result_text'])
+        self.assertTrue(post.call_args.kwargs['stream'])
+        self.assertTrue(response.closed)
+
+    def test_analysis_endpoint_is_async_and_still_requires_login(self):
+        self.assertTrue(asyncio.iscoroutinefunction(api_process_db_row))
+        self.assertTrue(api_process_db_row.csrf_exempt)
+        request = RequestFactory().post('/activities/api/process-db-row/', data='{}', content_type='application/json')
+        request.user = SimpleNamespace(is_authenticated=False)
+        response = async_to_sync(api_process_db_row)(request)
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(f"{settings.LOGIN_URL}?next=/activities/api/process-db-row/", response.url)
+
+    def test_answer_detail_reads_streaming_endpoint(self):
+        source = get_template('activities/answer_detail.html').template.source
+        self.assertIn('api_stream_db_row', source)
+        self.assertIn('readAnalysisStream', source)
+
+
+class LLMTransportTests(SimpleTestCase):
+    def tearDown(self):
+        close_llm_sessions()
+
+    def test_each_provider_reuses_one_pooled_session(self):
+        self.assertEqual('openai', provider_for_url('https://api.openai.com/v1/responses'))
+        self.assertEqual('gemini', provider_for_url('https://generativelanguage.googleapis.com/v1beta/models/x'))
+        self.assertIs(get_llm_session('openai'), get_llm_session('openai'))
+        self.assertIsNot(get_llm_session('openai'), get_llm_session('anthropic'))
+
+    @override_settings(LLM_HTTP_POOL_MAXSIZE=2, AI_BACKGROUND_WORKERS=8, LLM_HTTP_CONNECT_TIMEOUT=5)
+    def test_pool_is_sized_for_background_workers_and_timeout_splits_connect(self):
+        adapter = get_llm_session('openai').get_adapter('https://api.openai.com/')
+        self.assertEqual(8, adapter._pool_maxsize)
+        self.assertEqual((5, 120), get_llm_timeout(120))
+
+    def test_token_bucket_reports_wait_until_refilled(self):
+        bucket = TokenBucket(60)
+        self.assertEqual(0, bucket.wait_time(60))
+        bucket.consume(60)
+        self.assertAlmostEqual(10, bucket.wait_time(10), delta=0.1)
+
+    def test_retry_after_header_wins_over_backoff(self):
+        self.assertEqual(2.0, get_retry_after_seconds(SimpleNamespace(headers={'Retry-After': '2'}), 0))
+        self.assertEqual(0.5, get_retry_after_seconds(SimpleNamespace(headers={'retry-after-ms': '500'}), 0))
+        self.assertLessEqual(get_retry_after_seconds(SimpleNamespace(headers={}), 2), 4)
+
+    @override_settings(LLM_RATE_LIMITS={'openai': {'rpm': 600, 'tpm': 10_000_000}})
+    def test_rate_limited_key_is_rested_and_next_key_is_used(self):
+        limited = SimpleNamespace(status_code=429, headers={'Retry-After': '20'}, close=lambda: None)
+        ok = SimpleNamespace(status_code=200, headers={})
+        with patch('activities.llm_transport.llm_post', side_effect=[limited, ok]) as post:
+            response = llm_request(
+                'https://api.openai.com/v1/chat/completions',
+                api_keys='rotation-key-a, rotation-key-b',
+                json={'model': 'gpt-test'},
+            )
+        self.assertIs(ok, response)
+        used_keys = [call.kwargs['headers']['Authorization'] for call in post.call_args_list]
+        self.assertEqual(2, len(set(used_keys)))
+
+    @override_settings(LLM_RATE_LIMITS={'openai': {'rpm': 600, 'tpm': 10_000_000}})
+    def test_async_request_rotates_keys_like_sync_request(self):
+        limited = SimpleNamespace(status_code=429, headers={'Retry-After': '20'}, aclose=AsyncMock())
+        ok = SimpleNamespace(status_code=200, headers={})
+        with patch('activities.llm_transport.allm_post', AsyncMock(side_effect=[limited, ok])) as post:
+            response = async_to_sync(allm_request)(
+                'https://api.openai.com/v1/chat/completions',
+                api_keys='async-key-a, async-key-b',
+                json={'model': 'gpt-test'},
+            )
+        self.assertIs(ok, response)
+        used_keys = [call.kwargs['headers']['Authorization'] for call in post.call_args_list]
+        self.assertEqual(2, len(set(used_keys)))
+        limited.aclose.assert_awaited_once()
+
+    def test_server_errors_and_post_send_failures_are_not_resent(self):
+        server_error = SimpleNamespace(status_code=503, headers={})
+        with patch('activities.llm_transport.llm_post', return_value=server_error) as post:
+            response = llm_request('https://api.openai.com/v1/chat/completions', api_keys='resend-key', json={})
+        self.assertIs(server_error, response)
+        self.assertEqual(1, post.call_count)
+
+        dropped = requests.ConnectionError(ConnectionResetError('연결 끊김'))
+        with patch('activities.llm_transport.llm_post', side_effect=dropped) as post:
+            with self.assertRaises(requests.ConnectionError):
+                llm_request('https://api.openai.com/v1/chat/completions', api_keys='resend-key', json={})
+        self.assertEqual(1, post.call_count)
+
+    def test_connect_failure_before_send_is_retried(self):
+        ok = SimpleNamespace(status_code=200, headers={})
+        refused = requests.ConnectionError(SimpleNamespace(reason=NewConnectionError(None, '연결 거부')))
+        with patch('activities.llm_transport.llm_post', side_effect=[refused, ok]) as post, \
+                patch('activities.llm_transport.time.sleep'):
+            response = llm_request('https://api.openai.com/v1/chat/completions', api_keys='connect-key', json={})
+        self.assertIs(ok, response)
+        self.assertEqual(2, post.call_count)
+
+    def test_async_client_is_closed_when_its_event_loop_ends(self):
+        async def get_clients():
+            first = await get_async_llm_client('openai')
+            self.assertIs(first, await get_async_llm_client('openai'))
+            return first, await get_async_llm_client('anthropic')
+
+        # WSGI에서 비동기 뷰를 부를 때처럼 호출마다 새 루프를 만들고 닫습니다.
+        clients = async_to_sync(get_clients)() + async_to_sync(get_clients)()
+        self.assertEqual(4, len({id(client) for client in clients}))
+        self.assertTrue(all(client.is_closed for client in clients))
+        self.assertEqual(0, len(_async_clients))
+
+    def test_key_wait_happens_before_taking_a_scheduler_slot(self):
+        ok = SimpleNamespace(status_code=200, headers={})
+        slot_held_while_waiting = []
+
+        def acquire(provider, api_keys, estimated_tokens):
+            slot_held_while_waiting.append(_slot_held.get())
+            return api_keys[0], _get_key_state(provider, api_keys[0])
+
+        with llm_caller(1, BATCH), \
+                patch('activities.llm_transport.acquire_api_key', side_effect=acquire), \
+                patch('activities.llm_transport.llm_post', return_value=ok):
+            llm_request('https://api.openai.com/v1/chat/completions', api_keys='slot-key', json={})
+        self.assertEqual([False], slot_held_while_waiting)
+
+    def test_streaming_response_keeps_key_in_flight_until_closed(self):
+        class FakeStream:
+            status_code = 200
+            headers = {}
+
+            def close(self):
+                self.closed = True
+
+            async def aclose(self):
+                self.closed = True
+
+        state = _get_key_state('openai', 'stream-key')
+        with patch('activities.llm_transport.llm_post', return_value=FakeStream()):
+            response = llm_request('https://api.openai.com/v1/responses', api_keys='stream-key', json={}, stream=True)
+        self.assertEqual(1, state.in_flight)
+        response.close()
+        self.assertEqual(0, state.in_flight)
+
+        async def open_and_close():
+            response = await allm_request('https://api.openai.com/v1/responses', api_keys='stream-key', json={},
+                                          stream=True)
+            in_flight = state.in_flight
+            await response.aclose()
+            return in_flight, response.closed
+
+        with patch('activities.llm_transport.allm_post', AsyncMock(return_value=FakeStream())):
+            self.assertEqual((1, True), async_to_sync(open_and_close)())
+        self.assertEqual(0, state.in_flight)
+
+    def test_gemini_key_goes_to_query_params(self):
+        ok = SimpleNamespace(status_code=200, headers={})
+        with patch('activities.llm_transport.llm_post', return_value=ok) as post:
+            llm_request('https://generativelanguage.googleapis.com/v1beta/models/g:generateContent',
+                        api_keys='gemini-key', json={})
+        self.assertEqual({'key': 'gemini-key'}, post.call_args.kwargs['params'])
+        self.assertNotIn('Authorization', post.call_args.kwargs['headers'])
+
+
 class AnswerCharacterCountTests(SimpleTestCase):
     def test_non_whitespace_length_excludes_spaces_tabs_and_linebreaks(self):
         self.assertEqual(6, non_whitespace_length('가 나\t다\n라마바'))
@@ -0,0 +1,152 @@
+"""일괄 분석을 시작하기 전에 입력·출력 토큰과 예상 비용(USD)을 어림하는 사전 추정 도구."""
+
+import threading
+from decimal import Decimal
+
+from django.db.models import Avg, F, FloatField
+
+from .attachment_context import (
+    SUMMARY_MAX_OUTPUT_TOKENS,
+    estimate_openai_cost_usd,
+    peek_analysis_ready_context,
+)
+from .models import AIUsageLog
+
+DEFAULT_EXPECTED_COMPLETION_TOKENS = 900
+COMPLETION_HISTORY_SIZE = 200
+# 페르소나·어조·학교급 안내·활동 맥락 규칙처럼 요청마다 붙는 시스템 프롬프트 부분의 어림값
+SYSTEM_PROMPT_OVERHEAD_TOKENS = 700
+# 학생 정보·구분 머리말 등 사용자 프롬프트의 고정 틀
+PROMPT_FRAMING_TOKENS = 40
+# 묶음 분석 기록은 한 행에 여러 답안의 출력이 담기므로 답안 수로 나눠 답안당 출력 토큰으로 셉니다.
+PER_ANSWER_COMPLETION_TOKENS = Avg(F('completion_tokens') * 1.0 / F('packed_answers'), output_field=FloatField())
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model):
+    """tiktoken이 설치되어 있으면 모델 토크나이저를 쓰고, 없거나 불러오지 못하면 None입니다."""
+    with _encodings_lock:
+        if model in _encodings:
+            return _encodings[model]
+        try:
+            import tiktoken
+        except ImportError:
+            encoding = None
+        else:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding('o200k_base')
+            except Exception:
+                # 인코딩 파일을 내려받지 못하는 환경에서는 어림 계산으로 대신합니다.
+                encoding = None
+        _encodings[model] = encoding
+        return encoding
+
+
+def count_tokens(text, model='gpt-4o-mini'):
+    text = text or ''
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 한글은 대체로 글자당 1토큰 안팎, 영문·숫자·공백은 약 4글자당 1토큰입니다.
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def get_expected_completion_tokens(teacher, model, max_tokens=None):
+    """최근 실제 분석의 답안당 응답 길이(캐시 재사용 제외) 평균. 교사 기록이 없으면 전체 평균을 씁니다."""
+    recent_logs = AIUsageLog.objects.filter(
+        operation=AIUsageLog.Operation.STUDENT_ANALYSIS,
+        ai_model=model,
+        is_cache_hit=False,
+        completion_tokens__gt=0,
+    )
+    for logs in (recent_logs.filter(teacher=teacher), recent_logs):
+        recent_ids = logs.order_by('-created_at').values_list('id', flat=True)[:COMPLETION_HISTORY_SIZE]
+        average = AIUsageLog.objects.filter(id__in=list(recent_ids)).aggregate(
+            average=PER_ANSWER_COMPLETION_TOKENS
+        )['average']
+        if average:
+            expected = int(round(average))
+            break
+    else:
+        expected = DEFAULT_EXPECTED_COMPLETION_TOKENS
+    return min(expected, max_tokens) if max_tokens else expected
+
+
+def _truncated_attachments(activity):
+    """한도에 걸려 일부만 맥락에 들어가는 첨부파일을 (파일명, 사유, 저장 글자 수)로 돌려줍니다."""
+    if activity is None:
+        return []
+    files = activity.files.exclude(extraction_stop_reason='').only('file', 'extraction_stop_reason', 'extracted_char_count')
+    return [
+        {
+            'filename': activity_file.filename,
+            'stop_reason': activity_file.extraction_stop_reason,
+            'extracted_char_count': activity_file.extracted_char_count,
+        }
+        for activity_file in files
+    ]
+
+
+def estimate_analysis_batch(*, activity, teacher, answers, system_prompt, instruction, model,
+                            max_completion_tokens=None):
+    """답안 목록을 실제로 호출하지 않고 입력·출력 토큰과 비용을 어림합니다.
+
+    활동 자료는 문항별로 한 번만 세고, 아직 없는 긴 자료 요약은 일회성 비용으로 따로 더합니다.
+    내용이 없는 답안은 분석에서 건너뛰므로 제외합니다.
+    한도에 걸려 뒷부분이 빠진 첨부파일은 truncated_attachments로 함께 알려 줍니다.
+    """
+    fixed_tokens = (
+        count_tokens(system_prompt, model) + count_tokens(instruction, model)
+        + SYSTEM_PROMPT_OVERHEAD_TOKENS + PROMPT_FRAMING_TOKENS
+    )
+    context_tokens = {}
+    one_time_usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+    prompt_tokens = 0
+    answer_count = 0
+    for answer in answers:
+        answer_content = answer.display_content
+        if not answer_content:
+            continue
+        if answer.question_id not in context_tokens:
+            context_text, pending_summary_source = peek_analysis_ready_context(
+                activity, answer.question, model=model
+            )
+            if pending_summary_source:
+                one_time_usage['prompt_tokens'] += count_tokens(pending_summary_source, model)
+                one_time_usage['completion_tokens'] += SUMMARY_MAX_OUTPUT_TOKENS
+                context_tokens[answer.question_id] = SUMMARY_MAX_OUTPUT_TOKENS
+            else:
+                context_tokens[answer.question_id] = count_tokens(context_text, model)
+        prompt_tokens += fixed_tokens + context_tokens[answer.question_id] + count_tokens(answer_content, model)
+        answer_count += 1
+
+    expected_completion = get_expected_completion_tokens(teacher, model, max_completion_tokens)
+    completion_tokens = expected_completion * answer_count
+    analysis_cost = estimate_openai_cost_usd(
+        model, {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens}
+    )
+    one_time_cost = estimate_openai_cost_usd(model, one_time_usage)
+    return {
+        'model': model,
+        'answer_count': answer_count,
+        'prompt_tokens': prompt_tokens + one_time_usage['prompt_tokens'],
+        'completion_tokens': completion_tokens + one_time_usage['completion_tokens'],
+        'expected_completion_tokens_per_answer': expected_completion,
+        'estimated_cost_usd': analysis_cost + one_time_cost,
+        'one_time_context_cost_usd': one_time_cost,
+        'uses_tokenizer': _get_encoding(model) is not None,
+        'truncated_attachments': _truncated_attachments(activity),
+    }
+
+
+def estimate_exceeds_budget(estimate, budget_status):
+    if not budget_status:
+        return False
+    return Decimal(estimate['estimated_cost_usd']) > budget_status['remaining']
@@ -81,6 +81,10 @@ urlpatterns = [
     path('analysis-work/<int:activity_id>/', activity_analysis_work, name='activity_analysis_work'),
     path('api/get-or-create-batch/', get_or_create_batch, name='get_or_create_batch'),
     path('api/process-db-row/', api_process_db_row, name='api_process_db_row'),
+    path('api/process-db-row/stream/', api_stream_db_row, name='api_stream_db_row'),
+    path('api/analysis-jobs/estimate/', api_estimate_analysis_job, name='api_estimate_analysis_job'),
+    path('api/analysis-jobs/', api_create_analysis_job, name='api_create_analysis_job'),
+    path('api/analysis-jobs/<int:job_id>/', api_analysis_job_status, name='api_analysis_job_status'),
 
     # 6. 내보내기 (export_views)
     path('submission/export/<int:activity_id>/', submission_export_excel, name='submission_export_excel'),
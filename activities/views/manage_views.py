@@ -16,6 +16,7 @@ from django.views.decorators.http import require_POST
 from .main_views import get_accessible_student_ids, get_form_config, get_student_tree
 
 # [핵심] 상위 폴더(..)의 models.py에서 모델들 가져오기
+from ..attachment_context import schedule_activity_context_warmup
 from ..models import Activity, Question, Answer, ActivityFile
 
 # [중요] 교사 권한 데코레이터 가져오기 (accounts 앱에서)
@@ -280,6 +281,9 @@ def unified_create(request):
                 conditions=activity.conditions
             )
 
+            # 첨부 추출·요약을 미리 만들어 첫 AI 분석이 기다리지 않게 합니다.
+            schedule_activity_context_warmup(activity)
+
             messages.success(request, f"'{sub_menu}' 시트가 성공적으로 생성되었습니다.")
             return redirect(f'/activities/list/?category={cat_code}&sub={sub_menu}')
 
@@ -498,6 +502,8 @@ def unified_update(request, activity_id):
         else:
             print(f"[경고-수정] 대상 학생이 선택되지 않음")
 
+        schedule_activity_context_warmup(activity)
+
         messages.success(request, f"'{activity.title}' 수정이 완료되었습니다.")
         return redirect(f'/activities/list/?category={activity.category}&sub={sub_menu}')
 
@@ -751,6 +757,8 @@ def creative_update(request, pk):
         if target_ids:
             activity.target_students.set(get_accessible_student_ids(request.user, target_ids))
             
+        schedule_activity_context_warmup(activity)
+
         # 수정 완료 후 상세 페이지로 이동
         return redirect('creative_detail', pk=activity.pk)
 
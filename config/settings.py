@@ -202,6 +202,64 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # 같은 도메인 내에서는 iframe(미리보기)을 허용하도록 설정
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
+# AI 일괄 분석 작업 풀 (activities/background.py, activities/analysis_jobs.py)
+# 워커 프로세스마다 스레드 풀이 하나씩 생기므로 gunicorn 워커 수와 함께 조정합니다.
+AI_BACKGROUND_WORKERS = 8
+AI_ANALYSIS_JOB_CONCURRENCY = 4
+# 처리 신호는 작업자 스레드 옆에서 AI_ANALYSIS_JOB_HEARTBEAT_SECONDS마다 갱신되고,
+# AI_ANALYSIS_JOB_STALE_SECONDS 동안 끊기면(프로세스 종료) 다른 프로세스가 이어받습니다.
+AI_ANALYSIS_JOB_STALE_SECONDS = 900
+AI_ANALYSIS_JOB_HEARTBEAT_SECONDS = 30
+# 짧은 답안(아래 글자 수 이하)은 최대 AI_ANALYSIS_PACK_SIZE개를 한 번의 AI 호출로 묶어 분석합니다.
+AI_ANALYSIS_PACK_SIZE = 5
+AI_ANALYSIS_PACK_MAX_ANSWER_CHARS = 1500
+
+# LLM API 호출용 keep-alive 연결 풀 (activities/llm_transport.py)
+LLM_HTTP_POOL_CONNECTIONS = 4
+LLM_HTTP_POOL_MAXSIZE = 16
+LLM_HTTP_CONNECT_TIMEOUT = 10
+LLM_HTTP_READ_TIMEOUT = 60
+# ASGI 비동기 뷰(httpx)에서 제공자별로 동시에 열어 둘 수 있는 최대 연결 수
+LLM_ASYNC_MAX_CONNECTIONS = 100
+# 429 응답·연결 전 실패 시 최대 시도 횟수와 키 하나당 분당 한도(워커 프로세스 단위). 5xx·시간 초과는 중복 과금을 피하려고 다시 보내지 않습니다.
+# 예: LLM_RATE_LIMITS = {'openai': {'rpm': 500, 'tpm': 200000}}
+LLM_MAX_ATTEMPTS = 4
+LLM_RATE_LIMITS = {}
+# 교사 간 LLM 동시 호출 공정 배분 (activities/llm_scheduler.py, 워커 프로세스 단위)
+# 전체 동시 호출 수, 교사 한 명의 일괄 분석이 동시에 쓸 수 있는 수, 화면 단건 요청 전용 예약 슬롯 수
+LLM_MAX_CONCURRENT_CALLS = 16
+LLM_MAX_CONCURRENT_CALLS_PER_TEACHER = 4
+LLM_INTERACTIVE_RESERVED_CALLS = 2
+# 교사 id별 배분 가중치(기본 1). 예: LLM_TEACHER_WEIGHTS = {12: 2}
+LLM_TEACHER_WEIGHTS = {}
+
+# 같은 모델·온도·프롬프트 분석 요청의 응답 재사용 (activities/response_cache.py)
+AI_RESPONSE_CACHE_TTL_SECONDS = 14 * 24 * 60 * 60
+AI_RESPONSE_CACHE_MAX_ENTRIES = 20000
+
+# 브라우저 재시도가 같은 분석을 다시 호출하지 않도록 하는 요청 키 보관·대기 시간(초) (activities/idempotency.py)
+AI_IDEMPOTENCY_TTL_SECONDS = 30 * 60
+AI_IDEMPOTENCY_WAIT_SECONDS = 150
+AI_IDEMPOTENCY_STALE_SECONDS = 300
+
+# 복사 허용 활동에서 대표 답안 하나로 묶는 답안 간 유사도 기준(0~1, activities/answer_clusters.py)
+AI_DUPLICATE_SIMILARITY_THRESHOLD = 0.9
+
+# 활동 자료 OCR·요약을 한 요청만 수행하도록 잡는 잠금의 최대 대기 시간(초) (activities/locks.py)
+AI_SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS = 180
+
+# 스캔 PDF 쪽 단위 OCR 동시 요청 수 (activities/attachment_context.py)
+AI_OCR_PARALLELISM = 4
+
+# 긴 활동 자료 처리 방식: 'retrieval'(문항 관련 첨부 발췌) 또는 'summary'(AI 요약)
+AI_ATTACHMENT_CONTEXT_MODE = 'retrieval'
+# 긴 자료 조각별 요약 동시 요청 수
+AI_SUMMARY_PARALLELISM = 4
+
+# 같은 페르소나·어조 설정으로 조립한 시스템 프롬프트 재사용 시간(초) (activities/prompt_cache.py)
+# 변경은 저장 즉시 같은 프로세스에 반영되고, 다른 워커 프로세스에는 이 시간 안에 반영됩니다.
+AI_PROMPT_CACHE_TTL_SECONDS = 600
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
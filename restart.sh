@@ -20,7 +20,17 @@ sleep 2
 
 # 4. 서버 실행 (8080 포트 고정 및 로그 기록)
 echo "4. 서버를 실행합니다 (Port: 8080)..."
-nohup gunicorn config.wsgi:application --bind 0.0.0.0:8080 > nohup.out 2>&1 &
+# 기본은 ASGI(uvicorn 워커): AI 분석 응답을 기다리는 요청이 시험·자동 저장 요청을 막지 않습니다.
+# 문제가 생기면 SERVER_MODE=wsgi ./restart.sh 로 기존 동기 워커로 되돌릴 수 있습니다.
+if [ "${SERVER_MODE:-asgi}" = "wsgi" ]; then
+    nohup gunicorn config.wsgi:application --bind 0.0.0.0:8080 > nohup.out 2>&1 &
+else
+    nohup gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker --workers ${WEB_CONCURRENCY:-2} --bind 0.0.0.0:8080 > nohup.out 2>&1 &
+fi
+
+# 4-1. 재시작 전에 진행 중이던 AI 일괄 분석 작업을 이어서 처리
+# 이전 워커가 아직 끝내는 중일 수 있으므로, 처리 신호가 끊긴 작업만 기다렸다가 넘겨받습니다.
+nohup python manage.py resume_analysis_jobs --wait >> nohup.out 2>&1 &
 
 # 5. 결과 확인
 echo "✅ 서버가 성공적으로 재시작되었습니다!"